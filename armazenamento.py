@@ -0,0 +1,682 @@
+"""Camada de armazenamento do Diário: Google Sheets (padrão) ou SQLite local.
+
+As duas implementações expõem as mesmas operações usadas pelo app. A aba de
+Dados é sempre entregue no formato largo (cabeçalho + linhas de texto, como o
+Sheets devolve), independente de como cada backend guarda os registros.
+
+Cada usuário tem o próprio diário: no Sheets, abas com o nome do usuário
+(`titulo_aba`) e abas de arquivo por ano; sem usuário, as abas originais.
+"""
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import gspread
+
+COLUNAS_FIXAS = ['Data', 'Hora', 'Escala de Bristol', 'Diarreia', 'Características', 'Remédios',
+                 'Circunferencia_Cintura', 'Circunferencia_Abdominal', 'Notas', 'Humor']
+COLUNA_CONSUMO = 'Consumo'  # Formato esparso: "ARROZ=2; OVO=1" (só o que foi consumido)
+COLUNAS_LEGADO = ['Circunferencia']
+COLUNA_ENVIO = 'ID Envio'  # Id da entrada da fila de envio: reenvio não duplica o registro
+CABECALHO_DADOS = COLUNAS_FIXAS + [COLUNA_CONSUMO]
+CABECALHO_CONFIG = ["Alimentos", "Sintomas"]
+CABECALHO_RECEITAS = ["NomeReceita", "IngredientesPrincipais", "IngredientesMenores", "Rastreadores"]
+
+
+def nome_seguro(usuario):
+    """Usuário como parte de título de aba ou nome de arquivo (sem caracteres proibidos no Sheets)."""
+    return re.sub(r"[^\w.@-]", "_", str(usuario).strip().lower())[:80]
+
+def titulo_aba(nome, usuario=''):
+    """'Dados' -> 'Dados_<usuario>' no diário de um usuário; sem usuário, o nome original."""
+    return f"{nome}_{nome_seguro(usuario)}" if usuario else nome
+
+def _ano(data):
+    achado = re.search(r"\b(\d{4})\b", str(data))
+    return int(achado.group(1)) if achado else None
+
+def limpar_cabecalho(linha):
+    linha = list(linha)
+    while linha and linha[-1] == '': linha.pop()
+    return linha
+
+def colunas_largas(headers):
+    """Colunas por alimento (formato largo antigo) no cabeçalho da aba de Dados."""
+    conhecidas = set(CABECALHO_DADOS) | set(COLUNAS_LEGADO) | {COLUNA_ENVIO, ''}
+    return [h for h in headers if h not in conhecidas]
+
+def _lista_csv(valor):
+    return [x.strip().upper() for x in str(valor).split(',') if x.strip()]
+
+def _nivel_texto(nivel):
+    nivel = float(nivel)
+    return str(int(nivel)) if nivel.is_integer() else str(nivel)
+
+def formatar_consumo(consumo):
+    """{'ARROZ': 2, 'OVO': 1} -> 'ARROZ=2; OVO=1' (níveis zero são omitidos)."""
+    return "; ".join(f"{item}={_nivel_texto(nivel)}" for item, nivel in consumo.items() if nivel)
+
+def ler_consumo(texto):
+    """Inverso de `formatar_consumo`."""
+    consumo = {}
+    for parte in str(texto or '').split(';'):
+        item, _, nivel = parte.rpartition('=')
+        try: consumo[item.strip()] = float(nivel)
+        except ValueError: continue
+    return consumo
+
+def separar_registro(headers, linha):
+    """Divide uma linha (formato largo antigo e/ou coluna Consumo) em (campos fixos, consumo)."""
+    fixos, consumo, circunferencia_legado = {}, {}, ''
+    for h, v in zip(headers, linha):
+        if h in COLUNAS_FIXAS: fixos[h] = v
+        elif h == COLUNA_CONSUMO:
+            for item, nivel in ler_consumo(v).items(): consumo[item] = max(consumo.get(item, 0), nivel)
+        elif h in COLUNAS_LEGADO: circunferencia_legado = v
+        elif h and h != COLUNA_ENVIO:
+            try: nivel = float(v)
+            except (TypeError, ValueError): continue
+            if nivel: consumo[h] = max(consumo.get(h, 0), nivel)
+    # Compatibilidade legado
+    if circunferencia_legado != '' and not fixos.get('Circunferencia_Cintura'):
+        fixos['Circunferencia_Cintura'] = circunferencia_legado
+    return fixos, consumo
+
+
+class Armazenamento:
+    """Interface comum dos backends.
+
+    `remoto` indica se vale manter snapshot local e sincronização em segundo plano.
+    """
+    remoto = False
+
+    @property
+    def id(self): raise NotImplementedError
+
+    def cabecalho(self):
+        """Cabeçalho atual da aba de Dados."""
+        raise NotImplementedError
+
+    def garantir_colunas(self, novos_headers):
+        """Cria colunas que faltam na aba de Dados; retorna as que foram realmente criadas."""
+        raise NotImplementedError
+
+    def ler_tudo(self):
+        """(cabeçalho, linhas) de todos os registros."""
+        raise NotImplementedError
+
+    def ler_novas_linhas(self, headers_conhecidos, linhas_lidas):
+        """(cabeçalho atual, linhas registradas depois das `linhas_lidas` já lidas)."""
+        raise NotImplementedError
+
+    def adicionar_registro(self, valores, consumo):
+        """Grava um registro: `valores` com os campos fixos e `consumo` como {item: nível}."""
+        raise NotImplementedError
+
+    def adicionar_registros(self, registros):
+        """Grava vários (valores, consumo) de uma vez, na ordem recebida."""
+        for valores, consumo in registros: self.adicionar_registro(valores, consumo)
+
+    def ids_gravados(self, ids):
+        """Quais dos `ids` da fila de envio já estão no diário (coluna COLUNA_ENVIO)."""
+        return set()
+
+    def ler_listas_config(self, padrao_alim, padrao_sint):
+        """Listas ordenadas de Alimentos e Sintomas (inicializadas com os padrões se vazias)."""
+        raise NotImplementedError
+
+    def adicionar_item_config(self, tipo, item, lista_atual):
+        """Acrescenta `item` à lista `tipo`; `lista_atual` é a lista como foi lida por `ler_listas_config`."""
+        raise NotImplementedError
+
+    def ler_receitas(self):
+        """{NOME: {'main': [...], 'minor': [...], 'trackers': [...]}}"""
+        raise NotImplementedError
+
+    def adicionar_receita(self, nome, main, minor, trackers):
+        raise NotImplementedError
+
+    # Manutenção da aba de Dados: só faz sentido no Sheets; nos outros backends não há o que fazer
+    def abas_arquivo(self):
+        """Títulos das abas de arquivo (anos fechados), do mais antigo ao mais novo."""
+        return []
+
+    def ler_arquivo(self, titulos):
+        """[(cabeçalho, linhas)] de cada aba de arquivo."""
+        return []
+
+    def arquivar_anos(self, ano_limite):
+        """Move os anos anteriores a `ano_limite` para o arquivo; retorna {ano: registros movidos}."""
+        return {}
+
+    def compactar_formato_longo(self):
+        """Migra registros antigos (uma coluna por alimento) para CABECALHO_DADOS; retorna o nome do backup."""
+        return None
+
+
+# ==============================================================================
+# GOOGLE SHEETS
+# ==============================================================================
+def criar_planilha_diario(cliente, nome, dono, pasta):
+    """Cria a planilha de um diário na pasta do Drive `pasta` e compartilha com o `dono` (e-mail).
+
+    A conta de serviço não tem cota própria no Drive: a pasta deve ser de uma pessoa (ou drive
+    compartilhado) e estar compartilhada com ela como editora. Só a aba de Dados nasce aqui;
+    Config e Receitas são criadas na primeira leitura (`ArmazenamentoSheets._aba`).
+    """
+    planilha = cliente.create(nome, folder_id=pasta)
+    dados = planilha.sheet1
+    dados.update_title("Dados")
+    dados.update(f"A1:{gspread.utils.rowcol_to_a1(1, len(CABECALHO_DADOS))}", [CABECALHO_DADOS])
+    if "@" in dono: planilha.share(dono, perm_type='user', role='writer', notify=False)
+    return planilha
+
+class ArmazenamentoSheets(Armazenamento):
+    """Planilha com abas Dados (sheet1, formato largo), Config e Receitas.
+
+    Com `usuario`, o diário é o dele: abas Dados_<usuario>, Config_<usuario> e Receitas_<usuario>
+    na mesma planilha. Anos fechados podem ir para abas Arquivo_AAAA[_<usuario>] (`arquivar_anos`).
+    """
+    remoto = True
+
+    def __init__(self, abrir_planilha, usuario=''):
+        self._abrir = abrir_planilha
+        self.usuario = usuario
+        self._workbook = None
+        self._abas = {}
+        self._abas_listadas = False
+        self._headers = None  # Último cabeçalho visto da aba de Dados (evita reler antes de gravar)
+
+    @property
+    def workbook(self):
+        # Conexão preguiçosa: permite montar o backend sem rede (partida pelo snapshot)
+        if self._workbook is None: self._workbook = self._abrir()
+        return self._workbook
+
+    @property
+    def id(self): return f"{self.workbook.id}_{nome_seguro(self.usuario)}" if self.usuario else self.workbook.id
+
+    def _listar_abas(self):
+        # Uma única chamada (`worksheets`) traz os handles de todas as abas
+        if not self._abas_listadas:
+            self._abas.update({sheet.title: sheet for sheet in self.workbook.worksheets()})
+            self._abas_listadas = True
+
+    def _aba(self, titulo, linhas=100, colunas=5, cabecalho=None):
+        """Handle da aba (criando se não existir), guardado para evitar buscar metadados a cada rerun."""
+        titulo = titulo_aba(titulo, self.usuario)
+        if titulo not in self._abas: self._listar_abas()
+        if titulo not in self._abas:
+            sheet = self.workbook.add_worksheet(title=titulo, rows=linhas, cols=colunas)
+            if cabecalho: sheet.update(f"A1:{gspread.utils.rowcol_to_a1(1, len(cabecalho))}", [cabecalho])
+            self._abas[titulo] = sheet
+        return self._abas[titulo]
+
+    def _dados(self):
+        if self.usuario: return self._aba("Dados", 1000, len(CABECALHO_DADOS), CABECALHO_DADOS)
+        if None not in self._abas: self._abas[None] = self.workbook.sheet1
+        return self._abas[None]
+
+    def cabecalho(self):
+        self._headers = limpar_cabecalho(self._dados().row_values(1))
+        return self._headers
+
+    def garantir_colunas(self, novos_headers, headers=None):
+        """Garante que existem colunas para os itens novos na aba de Dados."""
+        if not novos_headers: return []
+        sheet_dados = self._dados()
+        headers = headers if headers is not None else self.cabecalho()
+        reais_novos = [h for h in dict.fromkeys(novos_headers) if h not in headers]
+        if reais_novos:
+            col_atual = len(headers)
+            if col_atual + len(reais_novos) > sheet_dados.col_count:
+                sheet_dados.add_cols(len(reais_novos) + 5)
+            cell_range = f"{gspread.utils.rowcol_to_a1(1, col_atual + 1)}:{gspread.utils.rowcol_to_a1(1, col_atual + len(reais_novos))}"
+            sheet_dados.update(cell_range, [reais_novos])
+            self._headers = headers + reais_novos
+        return reais_novos
+
+    def ler_tudo(self):
+        valores = self._dados().get_all_values()
+        if not valores: return [], []
+        self._headers = limpar_cabecalho(valores[0])
+        return self._headers, valores[1:]
+
+    def ler_novas_linhas(self, headers_conhecidos, linhas_lidas):
+        # Uma única chamada: cabeçalho + intervalo a partir da última linha já lida
+        ultima_col = re.sub(r'\d', '', gspread.utils.rowcol_to_a1(1, max(len(headers_conhecidos), 1)))
+        linha_cab, novas = self._dados().batch_get(["1:1", f"A{max(linhas_lidas + 1, 2)}:{ultima_col}"])
+        self._headers = limpar_cabecalho(linha_cab[0] if linha_cab else [])
+        if linhas_lidas:
+            # A última linha lida sumiu: a aba foi reescrita (ex: `arquivar_anos`), cabeçalho None força recarga
+            if not novas or not any(novas[0]):
+                self._abas_listadas = False  # Pode haver abas de arquivo novas
+                return None, []
+            novas = novas[1:]
+        return self._headers, list(novas)
+
+    def adicionar_registro(self, valores, consumo):
+        self.adicionar_registros([(valores, consumo)])
+
+    def adicionar_registros(self, registros):
+        # Itens vão na coluna Consumo: comida nova não cria coluna e a linha não carrega zeros.
+        # Cabeçalho vem do último lido; o caso normal é um único append_rows.
+        headers = self._headers if self._headers is not None else self.cabecalho()
+        campos = dict.fromkeys(k for valores, _ in registros for k in valores)
+        cols_faltantes = [k for k in list(campos) + [COLUNA_CONSUMO] if k not in headers]
+        if cols_faltantes: headers = headers + self.garantir_colunas(cols_faltantes, headers)
+
+        linhas = [[formatar_consumo(consumo) if h == COLUNA_CONSUMO else valores.get(h, "") for h in headers]
+                  for valores, consumo in registros]
+        if linhas: self._dados().append_rows(linhas)
+
+    def ids_gravados(self, ids):
+        headers = self.cabecalho()
+        if COLUNA_ENVIO not in headers: return set()
+        return set(ids) & set(self._dados().col_values(headers.index(COLUNA_ENVIO) + 1))
+
+    def compactar_formato_longo(self):
+        """Migra a aba de Dados do formato largo (uma coluna por alimento) para CABECALHO_DADOS.
+
+        A coluna COLUNA_ENVIO, se existir, continua no fim com os ids de cada linha (a fila de
+        envio confere neles antes de reenviar). Antes de reescrever, duplica a aba original
+        como backup. Retorna o nome do backup.
+        """
+        sheet = self._dados()
+        headers, linhas = self.ler_tudo()
+        envio = headers.index(COLUNA_ENVIO) if COLUNA_ENVIO in headers else None
+        cabecalho = CABECALHO_DADOS + ([COLUNA_ENVIO] if envio is not None else [])
+        novas = [cabecalho]
+        for linha in linhas:
+            if not any(linha): continue
+            fixos, consumo = separar_registro(headers, linha)
+            novas.append([fixos.get(h, '') for h in COLUNAS_FIXAS] + [formatar_consumo(consumo)]
+                         + ([linha[envio] if envio < len(linha) else ''] if envio is not None else []))
+
+        nome_backup = f"{sheet.title}_largo_{datetime.now():%Y%m%d_%H%M}"
+        self.workbook.duplicate_sheet(sheet.id, new_sheet_name=nome_backup)
+        sheet.clear()
+        sheet.resize(rows=max(len(novas), 2), cols=len(cabecalho))
+        sheet.update(f"A1:{gspread.utils.rowcol_to_a1(len(novas), len(cabecalho))}", novas)
+        self._headers = list(cabecalho)
+        return nome_backup
+
+    def abas_arquivo(self):
+        """Títulos das abas de arquivo deste diário, do ano mais antigo ao mais novo."""
+        self._listar_abas()
+        padrao = re.compile(r"Arquivo_(\d{4})" + re.escape(titulo_aba('', self.usuario)))
+        return sorted(t for t in self._abas if isinstance(t, str) and padrao.fullmatch(t))
+
+    def ler_arquivo(self, titulos):
+        """[(cabeçalho, linhas)] de cada aba de arquivo, todas numa única chamada."""
+        if not titulos: return []
+        resposta = self.workbook.values_batch_get([f"'{t}'" for t in titulos])
+        blocos = []
+        for intervalo in resposta.get('valueRanges', []):
+            valores = intervalo.get('values', [])
+            blocos.append((limpar_cabecalho(valores[0]), valores[1:]) if valores else ([], []))
+        return blocos
+
+    def arquivar_anos(self, ano_limite):
+        """Move os registros de anos anteriores a `ano_limite` da aba de Dados para uma aba de arquivo por ano.
+
+        Cada ano vai (em CABECALHO_DADOS) para Arquivo_AAAA[_<usuario>], criada se preciso, e só
+        depois a aba de Dados é reescrita sem ele. A reescrita é um único `update` no lugar (as
+        linhas que sobram no fim vão em branco), sem `clear`: a aba nunca fica vazia e uma queda
+        no meio duplica registros, não perde. Quem chama deve segurar a fila de envio deste
+        diário (`FilaEnvio.segurar`) para nenhuma linha entrar entre a leitura e a reescrita.
+        Retorna {ano: registros movidos}.
+        """
+        headers, linhas = self.ler_tudo()
+        por_ano, manter = {}, []
+        for linha in linhas:
+            if not any(linha): continue
+            fixos, consumo = separar_registro(headers, linha)
+            ano = _ano(fixos.get('Data', ''))
+            if ano is not None and ano < ano_limite:
+                por_ano.setdefault(ano, []).append([fixos.get(h, '') for h in COLUNAS_FIXAS] + [formatar_consumo(consumo)])
+            else: manter.append(linha[:len(headers)])
+        if not por_ano: return {}
+
+        for ano, novas in sorted(por_ano.items()):
+            self._aba(f"Arquivo_{ano}", len(novas) + 1, len(CABECALHO_DADOS), CABECALHO_DADOS).append_rows(novas)
+        reescrita = [headers] + manter + [[''] * len(headers) for _ in range(len(linhas) - len(manter))]
+        self._dados().update(f"A1:{gspread.utils.rowcol_to_a1(len(reescrita), len(headers))}", reescrita)
+        return {ano: len(novas) for ano, novas in sorted(por_ano.items())}
+
+    def ler_listas_config(self, padrao_alim, padrao_sint):
+        sheet = self._aba("Config", 100, 5, CABECALHO_CONFIG)
+        # As duas colunas numa chamada só
+        col_alim, col_sint = sheet.batch_get(["A2:A", "B2:B"])
+        vals_alim = [linha[0] if linha else '' for linha in col_alim]
+        vals_sint = [linha[0] if linha else '' for linha in col_sint]
+
+        # Inicializa se vazio
+        if not vals_alim:
+            sheet.update(f"A2:A{len(padrao_alim)+1}", [[x] for x in padrao_alim])
+            vals_alim = list(padrao_alim)
+        if not vals_sint:
+            sheet.update(f"B2:B{len(padrao_sint)+1}", [[x] for x in padrao_sint])
+            vals_sint = list(padrao_sint)
+        return sorted(vals_alim), sorted(vals_sint)
+
+    def adicionar_item_config(self, tipo, item, lista_atual):
+        # A lista lida vai até a última célula preenchida da coluna: a próxima linha livre
+        # sai dela (cabeçalho + itens), então é uma escrita só, sem reler a coluna
+        sheet = self._aba("Config", 100, 5, CABECALHO_CONFIG)
+        linha = len(lista_atual) + 2
+        if linha > sheet.row_count: sheet.add_rows(100)
+        sheet.update(f"{'A' if tipo == 'Alimentos' else 'B'}{linha}", [[item]])
+
+    def ler_receitas(self):
+        records = self._aba("Receitas", 100, 4, CABECALHO_RECEITAS).get_all_records()
+        receitas = {}
+        for row in records:
+            if row['NomeReceita']:
+                receitas[str(row['NomeReceita']).upper()] = {
+                    'main': _lista_csv(row['IngredientesPrincipais']),
+                    'minor': _lista_csv(row.get('IngredientesMenores', '')),
+                    'trackers': _lista_csv(row.get('Rastreadores', ''))}
+        return receitas
+
+    def adicionar_receita(self, nome, main, minor, trackers):
+        self._aba("Receitas", 100, 4, CABECALHO_RECEITAS).append_row([nome, ",".join(main), ",".join(minor), ",".join(trackers)])
+
+
+# ==============================================================================
+# SQLITE (local, sem cota de API)
+# ==============================================================================
+_ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS registros (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data_hora TEXT,
+    data TEXT, hora TEXT, bristol TEXT, diarreia TEXT, caracteristicas TEXT, remedios TEXT,
+    cintura TEXT, abdominal TEXT, notas TEXT, humor TEXT,
+    envio_id TEXT  -- id da entrada da fila de envio (COLUNA_ENVIO)
+);
+CREATE INDEX IF NOT EXISTS idx_registros_data_hora ON registros (data_hora);
+
+-- Formato longo: uma linha por item consumido (zeros não são gravados)
+CREATE TABLE IF NOT EXISTS consumo (
+    registro_id INTEGER NOT NULL REFERENCES registros (id),
+    item TEXT NOT NULL,
+    nivel REAL NOT NULL,
+    PRIMARY KEY (registro_id, item)
+);
+CREATE INDEX IF NOT EXISTS idx_consumo_item ON consumo (item, registro_id);
+
+CREATE TABLE IF NOT EXISTS config (tipo TEXT NOT NULL, item TEXT NOT NULL, PRIMARY KEY (tipo, item));
+CREATE TABLE IF NOT EXISTS receitas (nome TEXT PRIMARY KEY, principais TEXT, menores TEXT, rastreadores TEXT);
+"""
+
+class ArmazenamentoSQLite(Armazenamento):
+    """Banco local com índice por data e tabela longa de consumo (registro, item, nível)."""
+    CAMPOS = {'Data': 'data', 'Hora': 'hora', 'Escala de Bristol': 'bristol', 'Diarreia': 'diarreia',
+              'Características': 'caracteristicas', 'Remédios': 'remedios', 'Circunferencia_Cintura': 'cintura',
+              'Circunferencia_Abdominal': 'abdominal', 'Notas': 'notas', 'Humor': 'humor'}
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._con = sqlite3.connect(caminho, check_same_thread=False)
+        self._lock = threading.Lock()  # Uma conexão compartilhada entre as sessões do Streamlit
+        with self._lock, self._con:
+            self._con.executescript(_ESQUEMA_SQLITE)
+            if 'envio_id' not in {c[1] for c in self._con.execute("PRAGMA table_info(registros)")}:
+                self._con.execute("ALTER TABLE registros ADD COLUMN envio_id TEXT")  # Banco anterior à fila de envio
+            self._con.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_registros_envio ON registros (envio_id)")
+
+    @property
+    def id(self): return f"sqlite-{os.path.basename(self.caminho)}"
+
+    def cabecalho(self):
+        return list(CABECALHO_DADOS)
+
+    def garantir_colunas(self, novos_headers):
+        # Esquema fixo: itens novos não criam colunas
+        return []
+
+    def ler_tudo(self):
+        return self.ler_novas_linhas(None, 0)
+
+    def ler_novas_linhas(self, headers_conhecidos, linhas_lidas):
+        # Registros só são acrescentados: ids são sequenciais e `linhas_lidas` é o último id lido
+        campos = list(self.CAMPOS.values())
+        with self._lock:
+            registros = self._con.execute(
+                f"SELECT id, {', '.join(campos)} FROM registros WHERE id > ? ORDER BY id", (linhas_lidas,)).fetchall()
+            consumo = self._con.execute(
+                "SELECT registro_id, item, nivel FROM consumo WHERE registro_id > ? ORDER BY registro_id, rowid",
+                (linhas_lidas,)).fetchall()
+
+        por_registro = {}
+        for registro_id, item, nivel in consumo: por_registro.setdefault(registro_id, {})[item] = nivel
+        linhas = [['' if v is None else v for v in r[1:]] + [formatar_consumo(por_registro.get(r[0], {}))] for r in registros]
+        return list(CABECALHO_DADOS), linhas
+
+    @staticmethod
+    def _data_hora_iso(data, hora):
+        try: return datetime.strptime(f"{data} {hora}", "%d/%m/%Y %H:%M").isoformat()
+        except (TypeError, ValueError): return None
+
+    def _inserir(self, valores, consumo):
+        fixos = {col: ('' if valores.get(nome) is None else str(valores.get(nome, ''))) for nome, col in self.CAMPOS.items()}
+        # Id repetido = lote reenviado pela fila depois de uma falha incerta: o registro já está aqui
+        cur = self._con.execute(
+            f"INSERT OR IGNORE INTO registros (data_hora, envio_id, {', '.join(fixos)}) VALUES (?, ?{', ?' * len(fixos)})",
+            [self._data_hora_iso(fixos['data'], fixos['hora']), valores.get(COLUNA_ENVIO) or None] + list(fixos.values()))
+        if not cur.rowcount: return
+        self._con.executemany("INSERT INTO consumo (registro_id, item, nivel) VALUES (?, ?, ?)",
+                              [(cur.lastrowid, item, float(nivel)) for item, nivel in consumo.items() if nivel])
+
+    def adicionar_registro(self, valores, consumo):
+        with self._lock, self._con: self._inserir(valores, consumo)
+
+    def adicionar_registros(self, registros):
+        with self._lock, self._con:
+            for valores, consumo in registros: self._inserir(valores, consumo)
+
+    def ids_gravados(self, ids):
+        ids, gravados = list(ids), set()
+        with self._lock:
+            for i in range(0, len(ids), 500):  # Abaixo do limite de parâmetros do SQLite
+                bloco = ids[i:i + 500]
+                gravados.update(r[0] for r in self._con.execute(
+                    f"SELECT envio_id FROM registros WHERE envio_id IN ({', '.join('?' * len(bloco))})", bloco))
+        return gravados
+
+    def ler_listas_config(self, padrao_alim, padrao_sint):
+        with self._lock, self._con:
+            listas = []
+            for tipo, padrao in (('Alimentos', padrao_alim), ('Sintomas', padrao_sint)):
+                vals = [r[0] for r in self._con.execute("SELECT item FROM config WHERE tipo = ?", (tipo,))]
+                if not vals:
+                    self._con.executemany("INSERT OR IGNORE INTO config (tipo, item) VALUES (?, ?)", [(tipo, x) for x in padrao])
+                    vals = list(padrao)
+                listas.append(sorted(vals))
+            return tuple(listas)
+
+    def adicionar_item_config(self, tipo, item, lista_atual):
+        with self._lock, self._con:
+            self._con.execute("INSERT OR IGNORE INTO config (tipo, item) VALUES (?, ?)", (tipo, item))
+
+    def ler_receitas(self):
+        with self._lock:
+            linhas = self._con.execute("SELECT nome, principais, menores, rastreadores FROM receitas").fetchall()
+        return {nome: {'main': _lista_csv(main), 'minor': _lista_csv(minor), 'trackers': _lista_csv(track)}
+                for nome, main, minor, track in linhas}
+
+    def adicionar_receita(self, nome, main, minor, trackers):
+        with self._lock, self._con:
+            self._con.execute("INSERT OR REPLACE INTO receitas (nome, principais, menores, rastreadores) VALUES (?, ?, ?, ?)",
+                              (nome.upper(), ",".join(main), ",".join(minor), ",".join(trackers)))
+
+    def importar_de(self, origem, padrao_alim=(), padrao_sint=()):
+        """Copia Config, Receitas e todos os registros de outro backend (ex: a planilha atual, com o arquivo).
+
+        Retorna quantos registros foram importados.
+        """
+        alim, sint = origem.ler_listas_config(list(padrao_alim), list(padrao_sint))
+        receitas = origem.ler_receitas()
+        blocos = origem.ler_arquivo(origem.abas_arquivo()) + [origem.ler_tudo()]
+        importados = 0
+        with self._lock, self._con:
+            self._con.executemany("INSERT OR IGNORE INTO config (tipo, item) VALUES (?, ?)",
+                                  [('Alimentos', x) for x in alim] + [('Sintomas', x) for x in sint])
+            self._con.executemany("INSERT OR REPLACE INTO receitas (nome, principais, menores, rastreadores) VALUES (?, ?, ?, ?)",
+                                  [(n, ",".join(r['main']), ",".join(r['minor']), ",".join(r['trackers'])) for n, r in receitas.items()])
+            for headers, linhas in blocos:
+                for linha in linhas:
+                    if not any(linha): continue
+                    self._inserir(*separar_registro(headers, linha))
+                    importados += 1
+        return importados
+
+
+# ==============================================================================
+# FILA DE ENVIO (outbox em disco)
+# ==============================================================================
+def _cota_excedida(erro):
+    """429: a API recusou a chamada, então é seguro reenviar sem conferir."""
+    return isinstance(erro, gspread.exceptions.APIError) and erro.code == 429
+
+class FilaEnvio:
+    """Registros esperando para ir ao backend, guardados num JSONL local.
+
+    `enfileirar` grava a entrada com fsync e volta na hora. Uma thread envia tudo o que
+    estiver pendente numa única gravação em lote por diário (`obter_armazenamento(usuario)`);
+    se falhar (planilha lenta, 429, sem rede), tenta de novo com backoff exponencial e jitter.
+    A entrada só sai do arquivo depois de enviada, então nada se perde se o app cair.
+
+    Cada linha leva o id da entrada (COLUNA_ENVIO na planilha, `envio_id` único no SQLite).
+    Só o 429 garante que nada foi gravado; depois de qualquer outra falha (ou de reiniciar
+    com fila pendente) o lote pode ter chegado, então antes de reenviar os ids já presentes
+    no diário são descartados.
+    """
+
+    def __init__(self, caminho, obter_armazenamento, ao_enviar=None, espera_inicial=2.0, espera_maxima=300.0):
+        self.caminho = caminho
+        self._obter_armazenamento = obter_armazenamento
+        self._ao_enviar = ao_enviar
+        self._espera_inicial, self._espera_maxima = espera_inicial, espera_maxima
+        self._lock = threading.Lock()
+        self._enviando = threading.Lock()  # Um lote por vez; `segurar` espera o que estiver em andamento
+        self._segurados = {}  # usuario -> quantos `segurar` ativos
+        self._acordar = threading.Event()
+        self._fila = self._ler()
+        self._incertos = {e.get('usuario', '') for e in self._fila}  # Diários cujo último envio pode ter chegado
+        self._proxima_tentativa = 0.0
+        self.tentativas = 0
+        self.ultimo_erro = None
+        threading.Thread(target=self._rodar, daemon=True).start()
+        if self._fila: self._acordar.set()
+
+    def _ler(self):
+        entradas = []
+        try:
+            with open(self.caminho, encoding="utf-8") as f:
+                for linha in f:
+                    try: entradas.append(json.loads(linha))
+                    except ValueError: continue  # Linha cortada por uma queda no meio da escrita
+        except FileNotFoundError:
+            pass
+        return entradas
+
+    def _regravar(self):
+        tmp = self.caminho + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entrada in self._fila: f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self.caminho)
+
+    def enfileirar(self, valores, consumo, usuario=''):
+        entrada = {'id': uuid.uuid4().hex, 'criado': datetime.now().isoformat(timespec='seconds'),
+                   'usuario': usuario, 'valores': valores, 'consumo': consumo}
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            with open(self.caminho, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+                f.flush(); os.fsync(f.fileno())
+            self._fila.append(entrada)
+        self._acordar.set()
+
+    def pendentes(self, usuario=None):
+        """Entradas ainda não enviadas (de todos os diários ou só do `usuario`)."""
+        with self._lock: return sum(1 for e in self._fila if usuario is None or e.get('usuario', '') == usuario)
+
+    @contextmanager
+    def segurar(self, usuario=''):
+        """Pausa o envio do diário `usuario` (ex: enquanto a aba de Dados é reescrita).
+
+        Entra só depois que o lote em andamento termina; as entradas continuam na fila e saem ao final.
+        """
+        with self._lock: self._segurados[usuario] = self._segurados.get(usuario, 0) + 1
+        with self._enviando: pass
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._segurados[usuario] -= 1
+                if not self._segurados[usuario]: del self._segurados[usuario]
+            self._acordar.set()
+
+    def tentar_agora(self):
+        """Ignora o backoff atual (ex: botão de reconectar)."""
+        self._proxima_tentativa = 0.0
+        self._acordar.set()
+
+    def _rodar(self):
+        espera = None
+        while True:
+            self._acordar.wait(espera)
+            self._acordar.clear()
+            restante = self._proxima_tentativa - time.monotonic()
+            if restante > 0: espera = restante; continue  # Ainda em backoff
+            with self._enviando:
+                espera = self._enviar()
+
+    def _enviar(self):
+        """Envia o que estiver pendente (menos os diários segurados); retorna a espera até a próxima rodada."""
+        with self._lock: lote = [e for e in self._fila if e.get('usuario', '') not in self._segurados]
+        if not lote: return None
+        por_usuario, enviados, erro = {}, set(), None
+        for e in lote: por_usuario.setdefault(e.get('usuario', ''), []).append(e)
+        for usuario, entradas in por_usuario.items():
+            try:
+                armazenamento = self._obter_armazenamento(usuario)
+                if usuario in self._incertos:
+                    ja_gravados = armazenamento.ids_gravados(e['id'] for e in entradas)
+                    self._incertos.discard(usuario)
+                    enviados.update(ja_gravados)
+                    entradas = [e for e in entradas if e['id'] not in ja_gravados]
+                if entradas:
+                    armazenamento.adicionar_registros([({**e['valores'], COLUNA_ENVIO: e['id']}, e['consumo']) for e in entradas])
+            except Exception as e:
+                erro = e  # Um diário com problema não segura os outros
+                if not _cota_excedida(e): self._incertos.add(usuario)
+                continue
+            enviados.update(e['id'] for e in entradas)
+
+        if enviados:
+            with self._lock:
+                self._fila = [e for e in self._fila if e['id'] not in enviados]
+                self._regravar()
+        if erro is not None:
+            self.tentativas += 1
+            self.ultimo_erro = str(erro) or type(erro).__name__
+            espera = min(self._espera_maxima, self._espera_inicial * 2 ** (self.tentativas - 1)) * random.uniform(0.5, 1.0)
+            self._proxima_tentativa = time.monotonic() + espera
+        else:
+            with self._lock: espera = 0 if any(e.get('usuario', '') not in self._segurados for e in self._fila) else None
+            self.tentativas, self.ultimo_erro = 0, None
+        if self._ao_enviar:
+            for usuario in {e.get('usuario', '') for e in lote if e['id'] in enviados}:
+                try: self._ao_enviar(usuario)
+                except Exception: pass
+        return espera
@@ -0,0 +1,223 @@
+"""Motor estatístico do Detetive: risco de crise por item para todas as janelas de uma vez.
+
+Unidade de análise é o dia em Porto Seguro. Um dia "tem gatilho" na janela L quando há
+crise em (dia, dia + L dias] (L = 0: até 23:59 do próprio dia). A primeira crise depois de
+cada dia é achada uma única vez (busca binária); a janela L vira só uma comparação.
+
+Para cada item e janela: risco nos dias com consumo (IC de Wilson), risco nos dias sem
+consumo, risco relativo (IC log/Katz ou bootstrap), p-valor com correção para múltiplas
+comparações e dose-resposta pelos níveis 1/2/3 (tendência de Cochran-Armitage).
+"""
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+
+Z_95 = 1.959963984540054
+NIVEIS = (1, 2, 3)
+CORRECOES = ('fdr', 'bonferroni', 'nenhuma')
+
+_erfc = np.vectorize(math.erfc, otypes=[float])
+
+
+def _dividir(a, b):
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    return np.divide(a, b, out=np.full(a.shape, np.nan), where=b > 0)
+
+
+def _p_bilateral(z):
+    return _erfc(np.abs(np.nan_to_num(z)) / math.sqrt(2))
+
+
+def wilson(sucessos, total, z=Z_95):
+    """Intervalo de Wilson (vetorizado) para sucessos/total. Retorna (inferior, superior)."""
+    n = np.asarray(total, dtype=float)
+    p = _dividir(sucessos, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centro = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+        margem = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return np.clip(centro - margem, 0, 1), np.clip(centro + margem, 0, 1)
+
+
+def corrigir_p(p, metodo='fdr'):
+    """Ajusta p-valores por coluna (uma coluna = uma janela, linhas = itens testados)."""
+    p = np.asarray(p, dtype=float)
+    if metodo == 'nenhuma' or p.size == 0: return p
+    m = np.sum(~np.isnan(p), axis=0)
+    if metodo == 'bonferroni': return np.minimum(1, p * m)
+
+    # Benjamini-Hochberg: p_(k) * m / k, com mínimo acumulado do maior para o menor
+    ordem = np.argsort(np.where(np.isnan(p), np.inf, p), axis=0)
+    ordenado = np.take_along_axis(p, ordem, axis=0)
+    posto = np.arange(1, p.shape[0] + 1)[:, None]
+    ajustado = np.fmin.accumulate((ordenado * m / posto)[::-1], axis=0)[::-1]  # fmin: NaN (não testado) não contamina
+    resultado = np.empty_like(p)
+    np.put_along_axis(resultado, ordem, np.minimum(1, ajustado), axis=0)
+    return resultado
+
+
+def _risco_relativo(a, n1, c, n0):
+    """RR e erro padrão de log(RR); correção de 0,5 (Haldane) só nas células com zero."""
+    zero = (a == 0) | (c == 0)
+    a_, c_ = a + 0.5 * zero, c + 0.5 * zero
+    n1_, n0_ = n1 + 1.0 * zero, n0 + 1.0 * zero
+    rr = _dividir(_dividir(a_, n1_), _dividir(c_, n0_))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ep = np.sqrt(1 / a_ - 1 / n1_ + 1 / c_ - 1 / n0_)
+    return rr, ep
+
+
+def _gatilhos_por_dia(dias, datas_crise, lags):
+    """gatilho[dia, lag]: há crise em (dia, fim da janela `lag`]. A primeira crise depois de cada dia sai de uma busca binária."""
+    crises = np.sort(pd.Series(datas_crise).dropna().to_numpy(dtype='datetime64[ns]'))
+    pos = np.searchsorted(crises, dias, side='right')
+    tem_crise = pos < len(crises)
+    primeira = crises[np.minimum(pos, max(len(crises) - 1, 0))] if len(crises) else dias
+    fim = dias[:, None] + np.where(lags == 0, np.timedelta64(23 * 60 + 59, 'm'), lags * np.timedelta64(1, 'D'))[None, :]
+    return tem_crise[:, None] & (primeira[:, None] <= fim)
+
+
+def _p_risco_relativo(rr, ep):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.log(rr) / ep
+    return np.where(np.isfinite(z), _p_bilateral(z), np.nan)
+
+
+def perfil_gatilhos(dias_porto, exposicao, datas_crise, lag_maximo=7, valor_minimo=1, min_dias=1,
+                    correcao='fdr', bootstrap=0, semente=0):
+    """Calcula o perfil de risco de todos os itens para as janelas 0..`lag_maximo`.
+
+    `dias_porto`: dias (meia-noite) em Porto Seguro. `exposicao`: DataFrame (item, Dia, nivel)
+    com o maior nível de cada item em cada um desses dias. Só itens com `min_dias` dias de
+    consumo entram na correção de p-valores. `bootstrap` > 0 troca o IC do RR pelo percentil
+    de `bootstrap` reamostragens binomiais.
+    Retorna {'perfil': (item, lag) -> estatísticas, 'dose': (item, lag, nivel) -> risco,
+    'basal': risco de todos os dias por janela}.
+    """
+    dias = np.unique(pd.Series(dias_porto).dropna().to_numpy(dtype='datetime64[ns]'))
+    lags = np.arange(lag_maximo + 1)
+    gatilho = _gatilhos_por_dia(dias, datas_crise, lags)
+
+    exposicao = exposicao[exposicao['Dia'].isin(dias)]
+    itens, idx_item = np.unique(exposicao['item'].astype(str).to_numpy(), return_inverse=True)
+    idx_dia = np.searchsorted(dias, exposicao['Dia'].to_numpy(dtype='datetime64[ns]'))
+    nivel = exposicao['nivel'].to_numpy()
+    n_itens, total_dias = len(itens), len(dias)
+
+    # Contagens por (item, nível, lag) numa passada; o resto sai por soma
+    dose_dias = np.zeros((n_itens, len(NIVEIS)))
+    dose_crises = np.zeros((n_itens, len(NIVEIS), len(lags)))
+    idx_nivel = np.clip(nivel, 1, len(NIVEIS)).astype(int) - 1
+    np.add.at(dose_dias, (idx_item, idx_nivel), 1)
+    np.add.at(dose_crises, (idx_item, idx_nivel), gatilho[idx_dia])
+
+    expostos = np.asarray(NIVEIS) >= valor_minimo
+    n1 = dose_dias[:, expostos].sum(axis=1)[:, None] * np.ones(len(lags))
+    a = dose_crises[:, expostos, :].sum(axis=1)
+    total_crises = gatilho.sum(axis=0)[None, :]
+    n0, c = total_dias - n1, total_crises - a
+
+    risco = _dividir(a, n1)
+    risco_inf, risco_sup = wilson(a, n1)
+    rr, ep = _risco_relativo(a, n1, c, n0)
+    p = _p_risco_relativo(rr, ep)
+    if bootstrap:
+        rng = np.random.default_rng(semente)
+        a_b = rng.binomial(n1.astype(int), np.nan_to_num(risco), size=(bootstrap,) + a.shape)
+        c_b = rng.binomial(n0.astype(int), np.nan_to_num(_dividir(c, n0)), size=(bootstrap,) + a.shape)
+        rr_b, _ = _risco_relativo(a_b, n1, c_b, n0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # Item consumido em todos os dias: IC indefinido
+            rr_inf, rr_sup = np.nanpercentile(rr_b, [2.5, 97.5], axis=0)
+    else:
+        with np.errstate(invalid='ignore', over='ignore'):
+            rr_inf, rr_sup = rr * np.exp(-Z_95 * ep), rr * np.exp(Z_95 * ep)
+
+    # Dose-resposta: tendência de Cochran-Armitage com escores 1, 2, 3
+    escores = np.asarray(NIVEIS, dtype=float)[None, :, None]
+    n_k = dose_dias[:, :, None]
+    n_tot = n_k.sum(axis=1)
+    p_med = _dividir(dose_crises.sum(axis=1), n_tot)
+    estatistica = (escores * (dose_crises - n_k * p_med[:, None, :])).sum(axis=1)
+    variancia = p_med * (1 - p_med) * ((n_k * escores**2).sum(axis=1) - (n_k * escores).sum(axis=1)**2 / np.where(n_tot > 0, n_tot, 1))
+    z_dose = _dividir(estatistica, np.sqrt(np.maximum(variancia, 0)))
+
+    grade = {'item': np.repeat(itens, len(lags)), 'lag': np.tile(lags, n_itens)}
+    perfil = pd.DataFrame({
+        **grade, 'dias': n1.ravel().astype(int), 'crises': a.ravel().astype(int), 'risco': risco.ravel(),
+        'risco_inf': risco_inf.ravel(), 'risco_sup': risco_sup.ravel(), 'risco_sem': _dividir(c, n0).ravel(),
+        'rr': rr.ravel(), 'rr_inf': rr_inf.ravel(), 'rr_sup': rr_sup.ravel(),
+        'p': p.ravel(), 'p_ajustado': corrigir_p(np.where(n1 >= min_dias, p, np.nan), correcao).ravel(),
+        'z_dose': z_dose.ravel(), 'p_dose': np.where(np.isnan(z_dose), np.nan, _p_bilateral(z_dose)).ravel()})
+    perfil = perfil[perfil['dias'] > 0].reset_index(drop=True)
+
+    dose = pd.DataFrame({
+        'item': np.repeat(itens, len(NIVEIS) * len(lags)),
+        'nivel': np.tile(np.repeat(NIVEIS, len(lags)), n_itens), 'lag': np.tile(lags, n_itens * len(NIVEIS)),
+        'dias': np.repeat(dose_dias.ravel(), len(lags)).astype(int), 'crises': dose_crises.ravel().astype(int)})
+    dose['risco'] = _dividir(dose['crises'], dose['dias'])
+
+    basal = pd.Series(_dividir(gatilho.sum(axis=0), total_dias), index=pd.Index(lags, name='lag'), name='basal')
+    return {'perfil': perfil, 'dose': dose, 'basal': basal}
+
+
+def combinacoes_gatilho(dias_porto, exposicao, datas_crise, janela=1, valor_minimo=1, min_dias=4,
+                        tamanho_maximo=2, correcao='fdr', max_frequentes=200):
+    """Risco de crise quando itens aparecem juntos no mesmo dia (pares e, opcionalmente, trios+).
+
+    Monta uma vez a matriz dia x item; pares saem de um produto matricial (dias juntos e dias
+    juntos com gatilho). Conjuntos maiores seguem o Apriori: só combinam conjuntos frequentes
+    (suporte >= `min_dias`) cujos subconjuntos também são, limitados aos `max_frequentes` de
+    maior suporte por tamanho. `sinergia` > 1: a combinação é pior que o pior item sozinho.
+    """
+    colunas = ['itens', 'tamanho', 'dias', 'crises', 'risco', 'risco_individual', 'sinergia', 'rr', 'rr_inf', 'rr_sup', 'p', 'p_ajustado']
+    dias = np.unique(pd.Series(dias_porto).dropna().to_numpy(dtype='datetime64[ns]'))
+    gatilho = _gatilhos_por_dia(dias, datas_crise, np.array([janela]))[:, 0]
+    exposicao = exposicao[exposicao['Dia'].isin(dias) & (exposicao['nivel'] >= valor_minimo)]
+    itens, idx_item = np.unique(exposicao['item'].astype(str).to_numpy(), return_inverse=True)
+    matriz = np.zeros((len(dias), len(itens)), dtype=bool)
+    matriz[np.searchsorted(dias, exposicao['Dia'].to_numpy(dtype='datetime64[ns]')), idx_item] = True
+
+    # Poda: item sem suporte mínimo não forma combinação frequente
+    suporte = matriz.sum(axis=0)
+    manter = suporte >= min_dias
+    itens, matriz, suporte = itens[manter], matriz[:, manter], suporte[manter]
+    risco_item = _dividir(matriz[gatilho].sum(axis=0), suporte)
+    if len(itens) < 2: return pd.DataFrame(columns=colunas)
+
+    m = matriz.astype(np.int32)
+    juntos, juntos_crise = m.T @ m, m[gatilho].T @ m[gatilho]
+    i, j = np.nonzero(np.triu(juntos >= min_dias, k=1))
+    conjuntos = [(int(a), int(b)) for a, b in zip(i, j)]
+    dias_conj, crises_conj = [int(n) for n in juntos[i, j]], [int(n) for n in juntos_crise[i, j]]
+
+    frequentes = list(range(len(conjuntos)))  # Posições em `conjuntos` do último tamanho
+    for tamanho in range(3, tamanho_maximo + 1):
+        anteriores = [conjuntos[k] for k in sorted(frequentes, key=lambda k: -dias_conj[k])[:max_frequentes]]
+        conhecidos = set(anteriores)
+        candidatos = [a + b[-1:] for a in anteriores for b in anteriores if a[:-1] == b[:-1] and a[-1] < b[-1]]
+        candidatos = [c for c in candidatos if all(c[:k] + c[k + 1:] in conhecidos for k in range(tamanho))]
+        frequentes = []
+        for c in candidatos:
+            presentes = matriz[:, list(c)].all(axis=1)
+            n = int(presentes.sum())
+            if n < min_dias: continue
+            frequentes.append(len(conjuntos))
+            conjuntos.append(c); dias_conj.append(n); crises_conj.append(int((presentes & gatilho).sum()))
+        if not frequentes: break
+
+    if not conjuntos: return pd.DataFrame(columns=colunas)
+    n1, a = np.asarray(dias_conj, dtype=float), np.asarray(crises_conj, dtype=float)
+    n0, c = len(dias) - n1, gatilho.sum() - a
+    rr, ep = _risco_relativo(a, n1, c, n0)
+    with np.errstate(invalid='ignore', over='ignore'):
+        rr_inf, rr_sup = rr * np.exp(-Z_95 * ep), rr * np.exp(Z_95 * ep)
+    p = _p_risco_relativo(rr, ep)
+    risco = _dividir(a, n1)
+    individual = np.array([np.nanmax(risco_item[list(conj)]) for conj in conjuntos])
+    return pd.DataFrame({
+        'itens': [' + '.join(itens[list(conj)]) for conj in conjuntos], 'tamanho': [len(conj) for conj in conjuntos],
+        'dias': n1.astype(int), 'crises': a.astype(int), 'risco': risco, 'risco_individual': individual,
+        'sinergia': _dividir(risco, individual), 'rr': rr, 'rr_inf': rr_inf, 'rr_sup': rr_sup,
+        'p': p, 'p_ajustado': corrigir_p(p[:, None], correcao)[:, 0]}, columns=colunas)
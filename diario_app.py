@@ -1,193 +1,652 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-import re
-import matplotlib.pyplot as plt
+from datetime import datetime
+import os
+import json
+import time
+import hashlib
+import threading
+import io
+from collections import OrderedDict
+from contextlib import nullcontext
 from wordcloud import WordCloud
 import gspread
 from google.oauth2.service_account import Credentials
 import pytz
+from armazenamento import ArmazenamentoSheets, ArmazenamentoSQLite, FilaEnvio, colunas_largas, criar_planilha_diario, nome_seguro
+from receitas import IndiceReceitas
+from detetive import perfil_gatilhos, combinacoes_gatilho
+from medicao import Medidor, ContadorAPI, etapa, instrumentar_cliente
+from simulacao import planilha_simulada
+from limites import LimitadorAPI
+from processamento import (consumo_vazio, tipar_linhas, tipar_categorias, concatenar, finalizar_dados, exposicao_diaria,
+                           multi_hot, montar_cubo_diario, contar_sintomas, serie_medidas)
 
 # --- 1. CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(page_title="Diário Intestinal V26", page_icon="💩", layout="wide")
 st.title("💩 Rastreador de Saúde Completo")
+medidor = Medidor().ativar()  # Etapas deste rerun (painel com ?debug=1)
 FUSO_BR = pytz.timezone('America/Sao_Paulo')
 
 # --- 2. CONFIGURAÇÃO GOOGLE SHEETS ---
 NOME_PLANILHA = "Diario_Intestinal_DB" 
+TTL_CACHE_SEGUNDOS = 600  # Leituras da planilha ficam em cache por aba até expirar ou serem invalidadas
+DIR_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot")  # Cópia local para partida rápida/offline
+# Backend: 'sheets' (padrão), 'sqlite' (local, sem cota de API) ou 'simulado' (diário sintético em memória, para medições)
+BACKEND_ARMAZENAMENTO = os.environ.get("DIARIO_BACKEND", "sheets")
+CAMINHO_SQLITE = os.environ.get("DIARIO_SQLITE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "diario.db"))
+# Registros do Diário ainda não enviados à planilha (sobrevive a quedas e reinícios)
+CAMINHO_FILA = os.environ.get("DIARIO_FILA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fila_envio.jsonl"))
+if BACKEND_ARMAZENAMENTO == "simulado":  # Snapshot e fila próprios: nada do diário sintético chega à planilha real
+    DIR_SNAPSHOT = os.path.join(DIR_SNAPSHOT, "simulado")
+    CAMINHO_FILA = os.path.splitext(CAMINHO_FILA)[0] + "_simulado.jsonl"
+# Diário sintético: dias de histórico e latência (s) de cada chamada à planilha simulada
+DIAS_SIMULADOS = int(os.environ.get("DIARIO_SIMULADO_DIAS", 365))
+LATENCIA_SIMULADA = float(os.environ.get("DIARIO_SIMULADO_LATENCIA", 0.3))
+USUARIOS_SIMULADOS = [u.strip() for u in os.environ.get("DIARIO_SIMULADO_USUARIOS", "").split(",") if u.strip()]
+# Um diário por pessoa. Com login (st.login, seção [auth] nos secrets) o usuário é o e-mail. Sem login, só com
+# DIARIO_USUARIO_NA_URL=1 vale ?diario=<nome> (qualquer um escolhe o diário: só para uso local/confiável); senão, o
+# diário original. Cada diário tem as próprias abas (Dados_<usuario>...) ou, com DIARIO_PLANILHA_POR_USUARIO=1,
+# a própria planilha (<NOME_PLANILHA>_<usuario>).
+USUARIO_NA_URL = os.environ.get("DIARIO_USUARIO_NA_URL") == "1"
+PLANILHA_POR_USUARIO = os.environ.get("DIARIO_PLANILHA_POR_USUARIO") == "1"
+# Pasta do Drive onde criar a planilha de quem ainda não tem (vazio: cada planilha é criada à mão e
+# compartilhada com a conta de serviço)
+PASTA_PLANILHAS = os.environ.get("DIARIO_PASTA_PLANILHAS", "")
+LIMITE_DIARIOS = int(os.environ.get("DIARIO_LIMITE_DIARIOS", 16))  # Diários com handles e cache em memória (LRU)
+ANOS_ATIVOS = int(os.environ.get("DIARIO_ANOS_ATIVOS", 1))  # Anos na aba de Dados; os anteriores podem ir para as abas de arquivo
 
 # Listas de Backup e Constantes
 LISTA_ALIM_BACKUP = ['ARROZ', 'FEIJÃO', 'OVO', 'FRANGO', 'CAFÉ', 'BANANA', 'GLÚTEN', 'LACTOSE', 'FRITURA']
 LISTA_SINT_BACKUP = ['Estufamento', 'Gases', 'Cólica', 'Dor Abdominal']
 LISTA_REMEDIOS_COMUNS = ['Buscopan', 'Simeticona', 'Probiótico', 'Lactase', 'Carvão']
 LISTA_RASTREADORES = ['GLÚTEN', 'LACTOSE', 'FRITURA', 'AÇÚCAR', 'CAFEÍNA', 'ÁLCOOL', 'LEITE DE VACA']
+LAG_MAXIMO = int(os.environ.get("DIARIO_LAG_MAXIMO", 7))  # Maior janela de efeito (dias) do Detetive
+# Filtros do Detetive (rótulo -> parâmetro); o pré-cálculo em segundo plano cobre todas as combinações
+FILTROS_QTD = {"Todas (1, 2, 3)": 1, "Só Exageros (3)": 3, "Normal e Exagero (2, 3)": 2}
+TIPOS_CRISE = {"🚨 Diarreia Aguda (Bristol 7)": 7, "Diarreia Geral (Bristol >= 5)": 5}
+MIN_DIAS_PADRAO = 4
+LIMITE_ARTEFATOS = 32  # Imagens/tabelas renderizadas guardadas (LRU, compartilhado entre sessões)
+# Cota da API do Sheets por usuário (todas as sessões do processo dividem o mesmo balde)
+COTA_LEITURAS_MINUTO = int(os.environ.get("DIARIO_COTA_LEITURAS", 60))
+COTA_ESCRITAS_MINUTO = int(os.environ.get("DIARIO_COTA_ESCRITAS", 60))
+CAMINHO_PERFIL = os.environ.get("DIARIO_PERFIL")  # JSONL com a medição de cada rerun (vazio: desligado)
+
+def tem_credenciais_google():
+    try: return "gcp_service_account" in st.secrets
+    except Exception: return False  # Sem secrets.toml
+
+def usuario_atual():
+    """Dono do diário desta sessão ('' = diário original)."""
+    try: com_login = "auth" in st.secrets
+    except Exception: com_login = False  # Sem secrets.toml
+    if not com_login: return st.query_params.get("diario", "").strip().lower() if USUARIO_NA_URL else ""
+    if not st.user.is_logged_in:
+        st.button("🔑 Entrar", on_click=st.login)
+        st.stop()
+    return st.user.email.strip().lower()
+
+USUARIO = usuario_atual()
+if USUARIO: DIR_SNAPSHOT = os.path.join(DIR_SNAPSHOT, "diarios", nome_seguro(USUARIO))  # Snapshot de cada diário na sua pasta
 
 # --- 3. FUNÇÕES DE BANCO DE DADOS E LÓGICA ---
 @st.cache_resource
-def conectar_google_sheets():
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    try:
+def contador_api():
+    """Contabilidade das chamadas ao Google (todas as sessões e threads do processo)."""
+    return ContadorAPI()
+
+@st.cache_resource
+def limitador_api():
+    """Balde de fichas, coalescência de leituras e repetição com espera (compartilhado entre sessões)."""
+    return LimitadorAPI(COTA_LEITURAS_MINUTO, COTA_ESCRITAS_MINUTO)
+
+@st.cache_resource
+def _cliente():
+    with etapa("Conexão Google Sheets"):
+        scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
         credentials_info = st.secrets["gcp_service_account"]
         creds = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-        client = gspread.authorize(creds)
-        return client.open(NOME_PLANILHA)
+        # O contador fica por dentro do limitador: conta cada tentativa real (inclusive as 429)
+        return limitador_api().envolver(instrumentar_cliente(gspread.authorize(creds), contador_api()))
+
+@st.cache_resource(max_entries=LIMITE_DIARIOS)
+def _conexao(nome, dono=''):
+    """Abre a planilha `nome`; a de um diário (`dono`) que ainda não existe é criada em PASTA_PLANILHAS."""
+    with etapa("Abrir planilha"):
+        try: return _cliente().open(nome)
+        except gspread.SpreadsheetNotFound:
+            if not (dono and PASTA_PLANILHAS): raise
+        with etapa("Criar planilha"): return criar_planilha_diario(_cliente(), nome, dono, PASTA_PLANILHAS)
+
+def nome_planilha(usuario):
+    return f"{NOME_PLANILHA}_{nome_seguro(usuario)}" if PLANILHA_POR_USUARIO and usuario else NOME_PLANILHA
+
+@st.cache_resource
+def _planilha_simulada():
+    return planilha_simulada(latencia=LATENCIA_SIMULADA, contador=contador_api(), usuarios=USUARIOS_SIMULADOS, dias=DIAS_SIMULADOS)
+
+@st.cache_resource(max_entries=LIMITE_DIARIOS)
+def _armazenamento(usuario):
+    """Pool de backends por usuário: cada diário guarda os próprios handles de abas (LRU de LIMITE_DIARIOS)."""
+    if BACKEND_ARMAZENAMENTO == "sqlite":
+        return ArmazenamentoSQLite(f"{os.path.splitext(CAMINHO_SQLITE)[0]}_{nome_seguro(usuario)}.db" if usuario else CAMINHO_SQLITE)
+    if BACKEND_ARMAZENAMENTO == "simulado": return ArmazenamentoSheets(_planilha_simulada, usuario)
+    return armazenamento_sheets(usuario)
+
+def armazenamento_sheets(usuario):
+    """Diário do `usuario` no Google Sheets (também a origem de `importar_de` no backend local)."""
+    if PLANILHA_POR_USUARIO and usuario: return ArmazenamentoSheets(lambda: _conexao(nome_planilha(usuario), usuario))
+    return ArmazenamentoSheets(lambda: _conexao(NOME_PLANILHA), usuario)
+
+def obter_armazenamento():
+    return _armazenamento(USUARIO)
+
+@st.cache_resource
+def fila_envio():
+    """Outbox compartilhado: o formulário só enfileira, a thread da fila grava no diário de cada registro."""
+    return FilaEnvio(CAMINHO_FILA, _armazenamento, ao_enviar=lambda usuario: invalidar_cache("Dados", usuario=usuario))
+
+def pausar_envio():
+    """Segura a fila deste diário enquanto a aba de Dados é reescrita (no backend local não há fila)."""
+    return fila_envio().segurar(USUARIO) if obter_armazenamento().remoto else nullcontext()
+
+def salvar_registro(valores, consumo):
+    """Grava direto no backend local; no Sheets passa pela fila. Retorna True se ficou pendente."""
+    armazenamento = obter_armazenamento()
+    if not armazenamento.remoto:
+        armazenamento.adicionar_registro(valores, consumo)
+        invalidar_cache("Dados")
+        return False
+    fila_envio().enfileirar(valores, consumo, USUARIO)
+    return True
+
+def conectar_armazenamento():
+    try:
+        armazenamento = obter_armazenamento()
+        armazenamento.id  # Força a conexão no Sheets
+        return armazenamento
+    except gspread.SpreadsheetNotFound:
+        conta = st.secrets.get("gcp_service_account", {}).get("client_email", "a conta de serviço")
+        st.error(f"❌ Planilha '{nome_planilha(USUARIO)}' não encontrada. Crie-a e compartilhe com {conta} como editor"
+                 + (", ou defina DIARIO_PASTA_PLANILHAS para criá-la automaticamente." if PLANILHA_POR_USUARIO and USUARIO else "."))
+        st.stop()
     except Exception as e:
         st.error(f"❌ Erro de Conexão: {e}")
         st.stop()
 
-def verificar_e_criar_colunas(sheet_dados, novos_headers):
-    """Garante que existem colunas para os itens novos na aba de Dados."""
-    if not novos_headers: return
-    headers = sheet_dados.row_values(1)
-    reais_novos = [h for h in novos_headers if h not in headers]
-    if reais_novos:
-        col_atual = len(headers)
-        if col_atual + len(reais_novos) > sheet_dados.col_count:
-            sheet_dados.add_cols(len(reais_novos) + 5)
-        cell_range = f"{gspread.utils.rowcol_to_a1(1, col_atual + 1)}:{gspread.utils.rowcol_to_a1(1, col_atual + len(reais_novos))}"
-        sheet_dados.update(cell_range, [reais_novos])
-
-def gerenciar_listas_config(workbook):
+# --- CACHE DE LEITURAS (por diário e aba, compartilhado entre as sessões do mesmo usuário) ---
+@st.cache_resource(max_entries=LIMITE_DIARIOS)
+def _cache_diario(usuario):
+    return {'entradas': {}, 'incremental': {}, 'geracao': {}, 'derivados': {}, 'artefatos': OrderedDict(), 'hits': 0, 'misses': 0,
+            'lock': threading.Lock(), 'lock_sync': threading.Lock()}
+
+def _cache_planilha(usuario=None):
+    """Cache do diário desta sessão (ou do `usuario`, para quem roda fora dela, como a fila de envio)."""
+    return _cache_diario(USUARIO if usuario is None else usuario)
+
+def ler_com_cache(chave, carregar, ttl=TTL_CACHE_SEGUNDOS):
+    """Devolve o valor em cache da aba `chave` ou chama `carregar()` se expirou/não existe."""
+    cache = _cache_planilha()
+    with cache['lock']:
+        entrada = cache['entradas'].get(chave)
+        if entrada and time.monotonic() - entrada[0] < ttl:
+            cache['hits'] += 1
+            return entrada[1]
+        cache['misses'] += 1
+    with etapa(f"Leitura {chave}"): valor = carregar()  # Exceções não são cacheadas
+    with cache['lock']: cache['entradas'][chave] = (time.monotonic(), valor)
+    return valor
+
+def ultima_leitura(chave):
+    """Último valor lido da aba, mesmo expirado (None se nunca foi lido): base para seguir offline."""
+    cache = _cache_planilha()
+    with cache['lock']: entrada = cache['entradas'].get(chave)
+    return entrada[1] if entrada else None
+
+def invalidar_cache(*chaves, usuario=None):
+    """Descarta só as abas informadas (ex: 'Dados' após salvar um registro)."""
+    cache = _cache_planilha(usuario)
+    with cache['lock']:
+        for chave in chaves:
+            cache['entradas'].pop(chave, None)
+            cache['geracao'][chave] = cache['geracao'].get(chave, 0) + 1
+
+def gravar_cache(chave, valor, geracao=None):
+    """Guarda um valor já lido; ignora se a aba foi invalidada depois de `geracao`."""
+    cache = _cache_planilha()
+    with cache['lock']:
+        if geracao is not None and cache['geracao'].get(chave, 0) != geracao: return
+        cache['entradas'][chave] = (time.monotonic(), valor)
+
+def derivado(nome, base, parametros, calcular, somente_cache=False):
+    """Produto calculado sobre `base` (o df em cache), refeito só quando a base ou os `parametros` mudam.
+
+    A base é comparada por identidade: cada versão dos dados publica um df novo, então um
+    acerto aqui é sempre da mesma versão. Entradas de versões antigas são descartadas.
+    Com `somente_cache`, devolve None em vez de calcular.
+    """
+    cache = _cache_planilha()
+    with cache['lock']: memo = cache['derivados'].get((nome, parametros))
+    if memo is not None and memo[0] is base: return memo[1]
+    if somente_cache: return None
+    with etapa(nome): valor = calcular()
+    with cache['lock']:
+        cache['derivados'] = {k: v for k, v in cache['derivados'].items() if v[0] is base}
+        cache['derivados'][(nome, parametros)] = (base, valor)
+    return valor
+
+def artefato(nome, conteudo, gerar, limite=LIMITE_ARTEFATOS):
+    """Artefato renderizado (PNG, tabela) memoizado pelo hash do `conteudo` que o gera, com descarte LRU.
+
+    Ao contrário de `derivado`, sobrevive a uma nova versão dos dados se a entrada não mudou.
+    """
+    chave = (nome, hashlib.sha1(repr(conteudo).encode()).hexdigest())
+    cache = _cache_planilha()
+    with cache['lock']:
+        if chave in cache['artefatos']:
+            cache['artefatos'].move_to_end(chave)
+            return cache['artefatos'][chave]
+    with etapa(nome): valor = gerar()
+    with cache['lock']:
+        cache['artefatos'][chave] = valor
+        while len(cache['artefatos']) > limite: cache['artefatos'].popitem(last=False)
+    return valor
+
+def status_cache():
+    cache = _cache_planilha()
+    with cache['lock']:
+        idades = {k: time.monotonic() - v[0] for k, v in cache['entradas'].items()}
+        return cache['hits'], cache['misses'], idades
+
+def gerenciar_listas_config(armazenamento):
     """Lê listas básicas de Alimentos e Sintomas."""
     try:
-        try: sheet = workbook.worksheet("Config")
-        except: 
-            sheet = workbook.add_worksheet(title="Config", rows=100, cols=5)
-            sheet.update("A1:B1", [["Alimentos", "Sintomas"]])
-        
-        vals_alim = sheet.col_values(1)[1:]
-        vals_sint = sheet.col_values(2)[1:]
-        
-        # Inicializa se vazio
-        if not vals_alim:
-            sheet.update(f"A2:A{len(LISTA_ALIM_BACKUP)+1}", [[x] for x in LISTA_ALIM_BACKUP])
-            vals_alim = LISTA_ALIM_BACKUP
-        if not vals_sint:
-            sheet.update(f"B2:B{len(LISTA_SINT_BACKUP)+1}", [[x] for x in LISTA_SINT_BACKUP])
-            vals_sint = LISTA_SINT_BACKUP
-            
-        vals_alim.sort()
-        vals_sint.sort()
-        return vals_alim, vals_sint, sheet
+        vals_alim, vals_sint = ler_com_cache("Config", lambda: salvar_snapshot(armazenamento, 'config',
+                                             armazenamento.ler_listas_config(LISTA_ALIM_BACKUP, LISTA_SINT_BACKUP)))
+        return list(vals_alim), list(vals_sint)
     except Exception as e:
+        anterior = ultima_leitura("Config")  # Sem conexão, segue com a última lista lida
+        if anterior: return list(anterior[0]), list(anterior[1])
         st.error(f"Erro Config: {e}")
-        return LISTA_ALIM_BACKUP, LISTA_SINT_BACKUP, None
+        return LISTA_ALIM_BACKUP, LISTA_SINT_BACKUP
 
-def obter_receitas(workbook):
-    """Lê receitas com estrutura Main/Minor/Trackers."""
+def obter_receitas(armazenamento):
+    """Lê receitas com estrutura Main/Minor/Trackers, já com a expansão compilada (IndiceReceitas)."""
     try:
-        try: sheet = workbook.worksheet("Receitas")
-        except: 
-            sheet = workbook.add_worksheet(title="Receitas", rows=100, cols=4)
-            sheet.update("A1:D1", [["NomeReceita", "IngredientesPrincipais", "IngredientesMenores", "Rastreadores"]])
-        
-        records = sheet.get_all_records()
-        receitas = {}
-        for row in records:
-            if row['NomeReceita']:
-                main = [x.strip().upper() for x in str(row['IngredientesPrincipais']).split(',') if x.strip()]
-                minor_raw = row.get('IngredientesMenores', '')
-                minor = [x.strip().upper() for x in str(minor_raw).split(',') if x.strip()]
-                trackers = [x.strip().upper() for x in str(row.get('Rastreadores', '')).split(',') if x.strip()]
-                receitas[row['NomeReceita'].upper()] = {'main': main, 'minor': minor, 'trackers': trackers}
-        return receitas, sheet
+        return ler_com_cache("Receitas", lambda: IndiceReceitas(salvar_snapshot(armazenamento, 'receitas', armazenamento.ler_receitas())))
     except:
-        return {}, None
+        return ultima_leitura("Receitas") or IndiceReceitas()
 
-def cadastrar_item_config(novo_item, tipo, sheet_config, lista_atual):
+def cadastrar_item_config(novo_item, tipo, armazenamento, lista_atual):
     """Salva novo item simples na aba Config."""
     item_clean = novo_item.strip().upper() if tipo == 'Alimentos' else novo_item.strip().title()
     if item_clean in lista_atual: return False, "Item já existe."
 
-    col_idx = 1 if tipo == 'Alimentos' else 2
-    col_values = sheet_config.col_values(col_idx)
-    prox_linha = len(col_values) + 1
-    sheet_config.update_cell(prox_linha, col_idx, item_clean)
-    
-    if tipo == 'Alimentos':
-        wb = sheet_config.spreadsheet
-        verificar_e_criar_colunas(wb.sheet1, [item_clean])
+    # Alimento novo não precisa de coluna: o consumo é gravado na coluna Consumo
+    armazenamento.adicionar_item_config(tipo, item_clean, lista_atual)
+    invalidar_cache("Config")
         
     return True, f"✅ {item_clean} cadastrado!"
 
+def mascara_crise(df, crise):
+    """Registros de crise: `crise` é um Bristol mínimo (TIPOS_CRISE) ou o nome de um sintoma do índice."""
+    if isinstance(crise, str):
+        sintomas = indice_marcas(df)['sintomas']
+        return sintomas[crise] if crise in sintomas.columns else pd.Series(False, index=df.index)
+    return df['Escala de Bristol'] >= crise
+
+def analisar_gatilhos(df, consumo, itens, crise, valor_minimo, min_dias, correcao, bootstrap, somente_cache=False):
+    """Perfil de risco (todas as janelas até LAG_MAXIMO) dos `itens` nos dias de Porto Seguro.
+
+    Guardado por (versão dos dados, parâmetros): trocar a janela só seleciona linhas do resultado.
+    """
+    parametros = (frozenset(itens), crise, valor_minimo, min_dias, correcao, bootstrap, LAG_MAXIMO)
+    def calcular():
+        df_analise = df[df['Porto_Seguro'] == True]
+        crises = df.loc[mascara_crise(df, crise), 'DataHora']
+        return perfil_gatilhos(df_analise['DataHora'].dt.normalize(), exposicao_diaria(df_analise, consumo, itens), crises,
+                               LAG_MAXIMO, valor_minimo, min_dias, correcao, bootstrap)
+    return derivado("gatilhos", df, parametros, calcular, somente_cache)
+
+def analisar_combinacoes(df, consumo, itens, crise, janela, valor_minimo, min_dias, tamanho_maximo, correcao, somente_cache=False):
+    """Itens consumidos juntos no mesmo dia (pares/trios) e o risco de crise da combinação."""
+    parametros = (frozenset(itens), crise, janela, valor_minimo, min_dias, tamanho_maximo, correcao)
+    def calcular():
+        df_analise = df[df['Porto_Seguro'] == True]
+        crises = df.loc[mascara_crise(df, crise), 'DataHora']
+        return combinacoes_gatilho(df_analise['DataHora'].dt.normalize(), exposicao_diaria(df_analise, consumo, itens), crises,
+                                   janela, valor_minimo, min_dias, tamanho_maximo, correcao)
+    return derivado("combinacoes", df, parametros, calcular, somente_cache)
+
+# --- PRÉ-CÁLCULO DO DETETIVE (segundo plano, compartilhado entre sessões) ---
+def _tarefas_precalculo(df, consumo, itens):
+    """Tabelas do Detetive para todos os filtros (janela, quantidade, tipo de crise) com os demais no padrão."""
+    for crise in TIPOS_CRISE.values():
+        for valor_minimo in FILTROS_QTD.values():
+            yield lambda b=crise, v=valor_minimo: analisar_gatilhos(df, consumo, itens, b, v, MIN_DIAS_PADRAO, 'fdr', 0)
+            for janela in range(LAG_MAXIMO + 1):
+                yield lambda b=crise, v=valor_minimo, j=janela: analisar_combinacoes(df, consumo, itens, b, j, v, MIN_DIAS_PADRAO, 2, 'fdr')
+
+def _precalcular(estado, consumo):
+    cache = _cache_planilha()
+    try:
+        for tarefa in _tarefas_precalculo(estado['base'], consumo, estado['itens']):
+            if cache.get('precalculo') is not estado: return  # Chegou uma versão mais nova dos dados
+            tarefa()
+            estado['feitos'] += 1
+        estado['fim'] = datetime.now(FUSO_BR)
+    except Exception as e:
+        estado['erro'] = str(e) or type(e).__name__
+
+def iniciar_precalculo(df, consumo, itens):
+    """Dispara, uma vez por versão dos dados, o pré-cálculo do Detetive numa thread.
+
+    Os resultados vão para o cache de derivados: todas as sessões leem a mesma tabela.
+    """
+    if df.empty: return
+    itens = tuple(itens)
+    cache = _cache_planilha()
+    with cache['lock']:
+        atual = cache.get('precalculo')
+        if atual is not None and atual['base'] is df and atual['itens'] == itens: return
+        estado = {'base': df, 'itens': itens, 'total': len(TIPOS_CRISE) * len(FILTROS_QTD) * (LAG_MAXIMO + 2), 'feitos': 0,
+                  'inicio': datetime.now(FUSO_BR), 'fim': None, 'erro': None}
+        cache['precalculo'] = estado
+    threading.Thread(target=_precalcular, args=(estado, consumo), daemon=True).start()
+
+def status_precalculo(df):
+    estado = _cache_planilha().get('precalculo')
+    return estado if estado is not None and estado['base'] is df else None
+
+def indice_marcas(df):
+    """Sintomas e remédios de cada registro em multi-hot ({'sintomas', 'remedios'}), um por versão dos dados."""
+    def calcular():
+        vazio = pd.Series('', index=df.index)
+        return {'sintomas': multi_hot(df.get('Características', vazio)), 'remedios': multi_hot(df.get('Remédios', vazio))}
+    return derivado("marcas", df, (), calcular)
+
+def gerar_nuvem_png(frequencias):
+    """PNG da nuvem de palavras (sem figura do matplotlib: nada fica aberto entre reruns)."""
+    wc = WordCloud(width=600, height=400, background_color='black', colormap='Pastel1').generate_from_frequencies(frequencias)
+    buffer = io.BytesIO()
+    wc.to_image().save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def _finalizar_estado(estado, receitas):
+    """Finaliza o estado incremental; sem linhas novas nem mudança nas receitas, devolve o mesmo (df, consumo).
+
+    Manter o mesmo objeto preserva a versão dos dados: derivados e pré-cálculo continuam válidos.
+    """
+    chave = (estado['linhas'], receitas.expansao)
+    if estado.get('final') and estado['final'][0] == chave: return estado['final'][1]
+    final = finalizar_dados(estado['df'], estado['consumo'], receitas)
+    estado['final'] = (chave, final)
+    return final
+
+def ler_arquivo(armazenamento, anterior=None):
+    """(abas, registros, consumo) das abas de arquivo (anos fechados), com `Registro` negativo.
+
+    A aba de Dados numera os registros a partir de 0, então os dois convivem no mesmo df.
+    O arquivo não muda depois de escrito: com as mesmas abas do estado `anterior`, os
+    registros saem dele (`Registro` < 0) sem reler a planilha.
+    """
+    abas = tuple(armazenamento.abas_arquivo())
+    if not abas: return abas, pd.DataFrame(), consumo_vazio()
+    if anterior and anterior.get('arquivo') == abas and not anterior['df'].empty:
+        return abas, anterior['df'][anterior['df']['Registro'] < 0], anterior['consumo'][anterior['consumo']['Registro'] < 0]
+    with etapa("Leitura Arquivo"): blocos = armazenamento.ler_arquivo(abas)
+    df, consumo, fim = pd.DataFrame(), consumo_vazio(), 0
+    for headers, linhas in blocos:
+        fim -= len(linhas)
+        df_aba, consumo_aba = tipar_linhas(headers, linhas, (), inicio=fim)  # Arquivo já está em CABECALHO_DADOS
+        df, consumo = concatenar(df, df_aba), concatenar(consumo, consumo_aba)
+    return abas, tipar_categorias(df), consumo.astype({'item': 'category'})
+
+def sincronizar_dados(armazenamento, cols_numericas, receitas):
+    """Lê da aba de Dados só as linhas acrescentadas desde a última leitura.
+
+    Como os registros só entram por `adicionar_registro`, basta lembrar quantas linhas já
+    foram lidas e o cabeçalho visto. Cabeçalho novo (colunas criadas por
+    `garantir_colunas`) ou mudança nas colunas numéricas que já estão no cabeçalho força
+    recarga completa, que relê só a aba de Dados (o arquivo é reaproveitado). Alimento ou
+    receita recém-cadastrado ainda não tem coluna, então não invalida o que foi lido.
+    Retorna (registros, consumo em formato longo).
+    """
+    cache = _cache_planilha()
+    with cache['lock_sync']:
+        estado = cache['incremental'].get('Dados')
+        def assinatura(headers): return tuple(sorted(cols_numericas & set(headers)))
+
+        if estado and estado['headers'] and estado['assinatura'] == assinatura(estado['headers']):
+            headers, novas = armazenamento.ler_novas_linhas(estado['headers'], estado['linhas'])
+            if headers == estado['headers']:
+                if novas:
+                    with etapa("Tipar linhas"): df_novas, consumo_novo = tipar_linhas(headers, novas, cols_numericas, inicio=estado['linhas'])
+                    estado['df'] = tipar_categorias(concatenar(estado['df'], df_novas))
+                    estado['consumo'] = concatenar(estado['consumo'], consumo_novo).astype({'item': 'category'})
+                    estado['linhas'] += len(novas)
+                    salvar_snapshot_dados(armazenamento, estado)
+                return _finalizar_estado(estado, receitas)
+
+        # Recarga completa
+        abas_arquivo, df_arquivo, consumo_arquivo = ler_arquivo(armazenamento, estado)
+        headers, linhas = armazenamento.ler_tudo()
+        with etapa("Tipar linhas"): df, consumo = tipar_linhas(headers, linhas, cols_numericas) if headers else (pd.DataFrame(), consumo_vazio())
+        if not df_arquivo.empty:
+            df = tipar_categorias(concatenar(df_arquivo, df))
+            consumo = concatenar(consumo_arquivo, consumo).astype({'item': 'category'})
+        estado = {'headers': headers, 'linhas': len(linhas), 'assinatura': assinatura(headers), 'arquivo': abas_arquivo, 'df': df, 'consumo': consumo}
+        cache['incremental']['Dados'] = estado
+        salvar_snapshot_dados(armazenamento, estado)
+        return _finalizar_estado(estado, receitas)
+
+def formato_largo_pendente():
+    """True se a aba de Dados ainda tem colunas por alimento (candidata a `compactar_formato_longo`)."""
+    estado = _cache_planilha()['incremental'].get('Dados')
+    return bool(estado and colunas_largas(estado['headers']))
+
+def ano_limite_arquivo():
+    """Registros de anos anteriores a este podem ir para o arquivo (ficam os ANOS_ATIVOS mais recentes)."""
+    return datetime.now(FUSO_BR).year - ANOS_ATIVOS + 1
+
+def anos_para_arquivar():
+    """Anos fechados que ainda estão na aba de Dados (candidatos a `arquivar_anos`)."""
+    estado = _cache_planilha()['incremental'].get('Dados')
+    if not estado or estado['df'].empty: return []
+    anos = estado['df'].loc[estado['df']['Registro'] >= 0, 'DataHora'].dt.year
+    return sorted(int(ano) for ano in anos[anos < ano_limite_arquivo()].unique())
+
+def forcar_recarga_completa():
+    """Descarta o estado incremental (ex: após editar linhas antigas direto na planilha)."""
+    cache = _cache_planilha()
+    with cache['lock_sync']: cache['incremental'].clear()
+    invalidar_cache("Dados")
+
+# --- SNAPSHOT LOCAL (partida rápida e modo offline) ---
+def _gravar_atomico(caminho, escrever):
+    tmp = caminho + ".tmp"
+    escrever(tmp)
+    os.replace(tmp, caminho)
+
+def _hash_cabecalho(headers):
+    return hashlib.sha1("\x1f".join(headers).encode()).hexdigest()[:12]
+
+def salvar_snapshot(armazenamento, chave, valor):
+    """Grava Config/Receitas em JSON ao lado dos dados. Falhas de disco não interrompem o app."""
+    if armazenamento.remoto: _gravar_json(f"{chave}_{armazenamento.id}.json", valor)
+    return valor
+
+def _gravar_json(nome, valor):
+    try:
+        os.makedirs(DIR_SNAPSHOT, exist_ok=True)
+        def escrever(tmp):
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(valor, f, ensure_ascii=False)
+        _gravar_atomico(os.path.join(DIR_SNAPSHOT, nome), escrever)
+    except Exception:
+        pass
+
+def salvar_snapshot_dados(armazenamento, estado):
+    """Grava o DataFrame tipado em Parquet, identificado pelo ID da planilha e hash do cabeçalho."""
+    if not armazenamento.remoto: return  # Backend local já é rápido
+    try:
+        id_planilha = armazenamento.id
+        os.makedirs(DIR_SNAPSHOT, exist_ok=True)
+        hash_cab = _hash_cabecalho(estado['headers'])
+        arquivo = os.path.join(DIR_SNAPSHOT, f"dados_{id_planilha}_{hash_cab}.parquet")
+        _gravar_atomico(arquivo, lambda tmp: estado['df'].to_parquet(tmp, index=False))
+        _gravar_atomico(arquivo.replace("dados_", "consumo_", 1), lambda tmp: estado['consumo'].to_parquet(tmp, index=False))
+        meta = {'planilha': NOME_PLANILHA, 'id': id_planilha, 'headers': estado['headers'], 'hash': hash_cab,
+                'linhas_dados': estado['linhas'], 'assinatura': list(estado['assinatura']), 'arquivo': list(estado.get('arquivo', ()))}
+        _gravar_json(f"dados_{id_planilha}.json", meta)
+        _gravar_json(f"planilha_{NOME_PLANILHA}.json", id_planilha)
+        for antigo in os.listdir(DIR_SNAPSHOT):
+            if antigo.startswith((f"dados_{id_planilha}_", f"consumo_{id_planilha}_")) and antigo.endswith(".parquet") and hash_cab not in antigo:
+                os.remove(os.path.join(DIR_SNAPSHOT, antigo))
+    except Exception:
+        pass
+
+def carregar_snapshot():
+    """Lê o último snapshot local desta planilha (ou None se não houver/estiver incompleto)."""
+    try:
+        def ler(nome):
+            with open(os.path.join(DIR_SNAPSHOT, nome), encoding="utf-8") as f: return json.load(f)
+        id_planilha = ler(f"planilha_{NOME_PLANILHA}.json")
+        meta = ler(f"dados_{id_planilha}.json")
+        if meta['hash'] != _hash_cabecalho(meta['headers']): return None
+        df = pd.read_parquet(os.path.join(DIR_SNAPSHOT, f"dados_{id_planilha}_{meta['hash']}.parquet"))
+        consumo = pd.read_parquet(os.path.join(DIR_SNAPSHOT, f"consumo_{id_planilha}_{meta['hash']}.parquet"))
+        lista_alim, lista_sint = ler(f"config_{id_planilha}.json")
+        receitas = IndiceReceitas(ler(f"receitas_{id_planilha}.json"))
+        estado = {'headers': meta['headers'], 'linhas': meta['linhas_dados'], 'assinatura': tuple(meta['assinatura']),
+                  'arquivo': tuple(meta.get('arquivo', ())), 'df': df, 'consumo': consumo}
+        return {'id': id_planilha, 'estado': estado, 'dados': finalizar_dados(df, consumo, receitas), 'lista_alim': lista_alim,
+                'lista_sint': lista_sint, 'receitas': receitas}
+    except Exception:
+        return None
+
+def _reconciliar_snapshot(snapshot):
+    """Roda em segundo plano: conecta, aplica só as linhas novas sobre o snapshot e publica no cache."""
+    cache = _cache_planilha()
+    geracoes = dict(cache['geracao'])
+    try:
+        armazenamento = obter_armazenamento()
+        listas = salvar_snapshot(armazenamento, 'config', armazenamento.ler_listas_config(LISTA_ALIM_BACKUP, LISTA_SINT_BACKUP))
+        receitas = IndiceReceitas(salvar_snapshot(armazenamento, 'receitas', armazenamento.ler_receitas()))
+        cols_numericas = set(listas[0] + LISTA_RASTREADORES + list(receitas.keys()))
+        with cache['lock_sync']:
+            if snapshot['id'] == armazenamento.id: cache['incremental'].setdefault('Dados', snapshot['estado'])
+        dados = sincronizar_dados(armazenamento, cols_numericas, receitas)
+        gravar_cache("Config", listas, geracoes.get("Config", 0))
+        gravar_cache("Receitas", receitas, geracoes.get("Receitas", 0))
+        gravar_cache("Dados", dados, geracoes.get("Dados", 0))
+        cache['offline'] = None
+    except Exception as e:
+        cache['offline'] = str(e) or type(e).__name__
+    finally:
+        cache['reconciliando'] = False
+
+def iniciar_reconciliacao():
+    cache = _cache_planilha()
+    if cache.get('snapshot') and not cache.get('reconciliando'):
+        cache['reconciliando'] = True
+        threading.Thread(target=_reconciliar_snapshot, args=(cache['snapshot'],), daemon=True).start()
+
+def aquecer_do_snapshot():
+    """Na primeira carga do processo, usa o snapshot local enquanto o Sheets é consultado em segundo plano.
+
+    Retorna o snapshot enquanto ele deve ser exibido (sincronizando ou offline), senão None.
+    """
+    cache = _cache_planilha()
+    with cache['lock']:
+        primeira_carga = 'snapshot' not in cache
+        if primeira_carga:
+            cache['snapshot'] = carregar_snapshot() if obter_armazenamento().remoto and not cache['entradas'] else None
+    if primeira_carga: iniciar_reconciliacao()
+    if cache['snapshot'] and (cache.get('reconciliando') or cache.get('offline')): return cache['snapshot']
+    return None
+
+def modo_somente_leitura():
+    return bool(_cache_planilha().get('offline'))
+
+def entrar_modo_offline(armazenamento, erro, lista_alim, lista_sint, receitas):
+    """Sincronização falhou com o app já aquecido: a última versão em memória vira o snapshot exibido.
+
+    Retorna o snapshot (None se nunca houve dados nesta sessão nem cópia local).
+    """
+    cache = _cache_planilha()
+    estado = cache['incremental'].get('Dados')
+    if estado and estado['headers']:
+        cache['snapshot'] = {'id': armazenamento.id, 'estado': estado, 'dados': _finalizar_estado(estado, receitas),
+                             'lista_alim': lista_alim, 'lista_sint': lista_sint, 'receitas': receitas}
+    if not cache.get('snapshot'): return None
+    cache['offline'] = str(erro) or type(erro).__name__
+    return cache['snapshot']
+
+def _dados_do_snapshot(snapshot):
+    lista_alim, lista_sint, receitas = list(snapshot['lista_alim']), list(snapshot['lista_sint']), snapshot['receitas']
+    lista_completa_selecao = sorted(list(set(lista_alim + list(receitas.keys()))))
+    df, consumo = snapshot['dados']
+    return df, consumo, lista_completa_selecao, lista_alim, lista_sint, receitas
+
 def carregar_dados_nuvem():
-    workbook = conectar_google_sheets()
-    sheet = workbook.sheet1
-    lista_alim, lista_sint, _ = gerenciar_listas_config(workbook)
-    receitas, _ = obter_receitas(workbook)
+    snapshot = aquecer_do_snapshot()
+    if snapshot is not None: return _dados_do_snapshot(snapshot)
+
+    armazenamento = conectar_armazenamento()
+    lista_alim, lista_sint = gerenciar_listas_config(armazenamento)
+    receitas = obter_receitas(armazenamento)
     
     # Lista combinada para exibição nos selects (Puros + Receitas)
     lista_completa_selecao = sorted(list(set(lista_alim + list(receitas.keys()))))
     
+    # Colunas (formato largo antigo) que DEVEM ser tratadas como consumo
+    # Inclui Alimentos Puros, Rastreadores e Nomes de Receitas (caso tenham sido salvas como coluna)
+    cols_numericas = set(lista_alim + LISTA_RASTREADORES + list(receitas.keys()))
+    
     try:
-        dados = sheet.get_all_records()
-        df = pd.DataFrame(dados)
-        if df.empty: return pd.DataFrame(), lista_completa_selecao, lista_alim, lista_sint, receitas
-
-        # --- TRATAMENTO NUMÉRICO ROBUSTO (Correção V25) ---
-        # Define todas as colunas que DEVEM ser tratadas como números para soma
-        # Inclui Alimentos Puros, Rastreadores e Nomes de Receitas (caso tenham sido salvas como coluna)
-        cols_numericas = lista_alim + LISTA_RASTREADORES + list(receitas.keys())
-        
-        # Interseção com colunas existentes no DF
-        cols_para_converter = [c for c in df.columns if c in cols_numericas]
-        
-        for col in cols_para_converter:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-        # Medidas
-        if 'Circunferencia_Cintura' in df.columns: df['Circunferencia_Cintura'] = pd.to_numeric(df['Circunferencia_Cintura'], errors='coerce')
-        if 'Circunferencia_Abdominal' in df.columns: df['Circunferencia_Abdominal'] = pd.to_numeric(df['Circunferencia_Abdominal'], errors='coerce')
-        # Compatibilidade legado
-        if 'Circunferencia' in df.columns and 'Circunferencia_Cintura' not in df.columns:
-             df['Circunferencia_Cintura'] = pd.to_numeric(df['Circunferencia'], errors='coerce')
-
-        df['Escala de Bristol'] = pd.to_numeric(df['Escala de Bristol'], errors='coerce').fillna(0)
-        
-        # Datas
-        df['DataHora'] = pd.to_datetime(df['Data'] + ' ' + df['Hora'], dayfirst=True, errors='coerce')
-        df = df.dropna(subset=['DataHora']).sort_values(by='DataHora', ascending=False).reset_index(drop=True)
-        
-        # --- LÓGICA DE PORTO SEGURO (Com Janela de Arraste de 3 Dias) ---
-        df['Porto_Seguro'] = False
-        crise_mask = (df['Escala de Bristol'] >= 5)
-        
-        # Precisamos iterar na ordem cronológica (do passado pro futuro) para verificar o arraste
-        df_cron = df.sort_values('DataHora').reset_index(drop=True)
-        
-        for i in range(len(df_cron)):
-            # Pula os primeiros 3 registros pois não tem histórico suficiente
-            if i < 3: continue
-            
-            dt_atual = df_cron.loc[i, 'DataHora']
-            dt_inicio_janela = dt_atual - timedelta(days=3)
-            
-            # Pega registros dos 3 dias anteriores
-            janela = df_cron[(df_cron['DataHora'] < dt_atual) & (df_cron['DataHora'] >= dt_inicio_janela)]
-            
-            # Se a janela não está vazia E não teve nenhuma crise nela -> É Porto Seguro
-            if not janela.empty and not janela[crise_mask].any().any():
-                df_cron.loc[i, 'Porto_Seguro'] = True
-        
-        # Retorna o DF original (ordem decrescente) mas com a coluna calculada
-        # (Fazemos um merge ou apenas reordenamos de volta)
-        df_final = df_cron.sort_values(by='DataHora', ascending=False).reset_index(drop=True)
-        
-        return df_final, lista_completa_selecao, lista_alim, lista_sint, receitas
+        df, consumo = ler_com_cache("Dados", lambda: sincronizar_dados(armazenamento, cols_numericas, receitas))
+        return df, consumo, lista_completa_selecao, lista_alim, lista_sint, receitas
     except Exception as e:
+        snapshot = entrar_modo_offline(armazenamento, e, lista_alim, lista_sint, receitas) if armazenamento.remoto else None
+        if snapshot is not None: return _dados_do_snapshot(snapshot)
         st.error(f"Erro dados: {e}")
-        return pd.DataFrame(), lista_completa_selecao, lista_alim, lista_sint, receitas
+        return pd.DataFrame(), consumo_vazio(), lista_completa_selecao, lista_alim, lista_sint, receitas
 
 # Carrega Dados
-df, lista_display, lista_alim_pura, lista_sint_pura, receitas_dict = carregar_dados_nuvem()
+with etapa("Carregar dados"): df, consumo, lista_display, lista_alim_pura, lista_sint_pura, receitas_dict = carregar_dados_nuvem()
+somente_leitura = modo_somente_leitura()
+# Detetive: analisa apenas Alimentos Puros e Rastreadores (Ingredientes), não nomes de pratos
+itens_analise = sorted(list(set(lista_alim_pura + LISTA_RASTREADORES)))
+iniciar_precalculo(df, consumo, itens_analise)
+
+with st.sidebar, etapa("Barra lateral"):
+    if USUARIO:
+        st.caption(f"👤 Diário de {USUARIO}")
+        if getattr(st.user, 'is_logged_in', False): st.button("Sair", on_click=st.logout)
+    hits, misses, idades = status_cache()
+    st.caption(f"⚡ Cache: {hits} acertos / {misses} leituras da planilha")
+    for aba, idade in sorted(idades.items()): st.caption(f"• {aba}: atualizado há {int(idade)}s")
+    if st.button("🔄 Recarregar tudo", help="Relê a planilha inteira (use após editar registros antigos direto no Sheets)"):
+        forcar_recarga_completa(); st.rerun()
+    cache_info = _cache_planilha()
+    if cache_info.get('offline'):
+        st.warning(f"📴 Offline — exibindo cópia local. Novos registros ficam na fila de envio. {cache_info['offline']}")
+        if st.button("🔌 Tentar reconectar"):
+            cache_info['offline'] = None; iniciar_reconciliacao(); fila_envio().tentar_agora(); st.rerun()
+    elif cache_info.get('reconciliando'):
+        st.info("📦 Exibindo cópia local enquanto sincroniza com a planilha...")
+    if obter_armazenamento().remoto:
+        fila = fila_envio()  # Também retoma envios pendentes de uma execução anterior
+        if fila.pendentes(USUARIO):
+            st.caption(f"📤 {fila.pendentes(USUARIO)} registro(s) aguardando envio" + (f" — nova tentativa em breve ({fila.ultimo_erro})" if fila.ultimo_erro else ""))
 
 # --- 4. INTERFACE ---
-aba_diario, aba_cadastros, aba_historico, aba_analise = st.tabs(["📝 Diário", "⚙️ Cadastros", "🗂️ Histórico", "📊 Detetive"])
+# Cada aba é uma página (st.navigation, no fim do script): só a página ativa roda no rerun
 
 # ==============================================================================
 # ABA: DIÁRIO (Entrada de Dados)
 # ==============================================================================
-with aba_diario:
+def pagina_diario():
     st.header("Registro Diário")
     agora_br = datetime.now(FUSO_BR)
     
@@ -220,10 +679,8 @@ with aba_diario:
         st.divider()
         notas_input = st.text_area("Notas", placeholder="Obs...")
         
+        # Não depende da conexão: offline o registro espera na fila de envio
         if st.form_submit_button("💾 SALVAR REGISTRO", type="primary", use_container_width=True):
-            wb = conectar_google_sheets()
-            sheet = wb.sheet1
-            
             # Prepara Inputs
             sintomas_finais = sintomas_sel
             bristol_save = bristol_escolhido if bristol_escolhido != "Nenhum" else ""
@@ -241,54 +698,26 @@ with aba_diario:
                 'Humor': ''
             }
             
-            # Lógica de Explosão (Receita -> Ingredientes)
+            # Lógica de Explosão (Receita -> Ingredientes, sub-receitas incluídas; Minor é sempre 1)
             ingredientes_processados = {} 
             def processar_item(item, nivel_consumo):
-                if item in receitas_dict:
-                    # Explode Receita
-                    for main in receitas_dict[item]['main']:
-                        ingredientes_processados[main] = max(ingredientes_processados.get(main, 0), nivel_consumo)
-                    for minor in receitas_dict[item]['minor']:
-                        ingredientes_processados[minor] = max(ingredientes_processados.get(minor, 0), 1) # Minor é sempre 1
-                    for track in receitas_dict[item]['trackers']:
-                        ingredientes_processados[track] = max(ingredientes_processados.get(track, 0), nivel_consumo)
-                    # Conta a receita também
-                    ingredientes_processados[item] = max(ingredientes_processados.get(item, 0), nivel_consumo)
-                else:
-                    # Item Puro
-                    ingredientes_processados[item] = max(ingredientes_processados.get(item, 0), nivel_consumo)
+                for ingrediente, nivel in receitas_dict.expandir(item, nivel_consumo).items():
+                    ingredientes_processados[ingrediente] = max(ingredientes_processados.get(ingrediente, 0), nivel)
 
             for item in sel_pouco: processar_item(item, 1)
             for item in sel_medio: processar_item(item, 2)
             for item in sel_muito: processar_item(item, 3)
             for item in comps_dia: processar_item(item, 2)
 
-            for ingred, nivel in ingredientes_processados.items(): valores_input[ingred] = nivel
-            
-            # Verifica colunas e salva
-            headers = sheet.row_values(1)
-            nova_linha = []
-            
-            cols_medidas = ['Circunferencia_Cintura', 'Circunferencia_Abdominal']
-            cols_faltantes = [c for c in cols_medidas if c not in headers] + [k for k in valores_input.keys() if k not in headers]
-            if cols_faltantes:
-                verificar_e_criar_colunas(sheet, cols_faltantes)
-                headers = sheet.row_values(1)
-            
-            for h in headers:
-                if h in valores_input: nova_linha.append(valores_input[h])
-                elif h in lista_alim_pura or h in lista_display or h in LISTA_RASTREADORES: nova_linha.append(valores_input.get(h, 0))
-                else: nova_linha.append("")
-            
-            sheet.append_row(nova_linha)
-            st.success("✅ Registro Salvo!")
-            st.cache_data.clear()
+            # Salva (itens vão em formato esparso, só o que foi consumido)
+            pendente = salvar_registro(valores_input, ingredientes_processados)
+            st.success("✅ Registro Salvo!" + (" Enviando para a planilha..." if pendente else ""))
             st.rerun()
 
 # ==============================================================================
 # ABA: CADASTROS (Cozinha)
 # ==============================================================================
-with aba_cadastros:
+def pagina_cadastros():
     st.header("Central de Cadastros")
     
     # 1. Itens Simples
@@ -296,21 +725,17 @@ with aba_cadastros:
         c_new1, c_new2 = st.columns(2)
         with c_new1:
             novo_alim_txt = st.text_input("Novo Alimento Puro (ex: Ovo)").upper()
-            if st.button("Salvar Alimento"):
+            if st.button("Salvar Alimento", disabled=somente_leitura):
                 if novo_alim_txt:
-                    wb = conectar_google_sheets()
-                    _, _, sheet_cfg = gerenciar_listas_config(wb)
-                    ok, msg = cadastrar_item_config(novo_alim_txt, 'Alimentos', sheet_cfg, lista_alim_pura)
-                    if ok: st.success(msg); st.cache_data.clear(); st.rerun()
+                    ok, msg = cadastrar_item_config(novo_alim_txt, 'Alimentos', conectar_armazenamento(), lista_alim_pura)
+                    if ok: st.success(msg); st.rerun()
                     else: st.warning(msg)
         with c_new2:
             novo_sint_txt = st.text_input("Novo Sintoma (ex: Aftas)").title()
-            if st.button("Salvar Sintoma"):
+            if st.button("Salvar Sintoma", disabled=somente_leitura):
                 if novo_sint_txt:
-                    wb = conectar_google_sheets()
-                    _, _, sheet_cfg = gerenciar_listas_config(wb)
-                    ok, msg = cadastrar_item_config(novo_sint_txt, 'Sintomas', sheet_cfg, lista_sint_pura)
-                    if ok: st.success(msg); st.cache_data.clear(); st.rerun()
+                    ok, msg = cadastrar_item_config(novo_sint_txt, 'Sintomas', conectar_armazenamento(), lista_sint_pura)
+                    if ok: st.success(msg); st.rerun()
                     else: st.warning(msg)
 
     st.divider()
@@ -323,10 +748,10 @@ with aba_cadastros:
             c_base, c_traco = st.columns(2)
             with c_base:
                 st.markdown("🧱 **Base** (Aumenta c/ consumo)")
-                ingreds_main = st.multiselect("Ingredientes Base", lista_alim_pura)
+                ingreds_main = st.multiselect("Ingredientes Base", lista_display, help="Receitas já cadastradas também podem ser ingredientes.")
             with c_traco:
                 st.markdown("🧂 **Temperos/Traços** (Fixo)")
-                ingreds_minor = st.multiselect("Ingredientes Traço", lista_alim_pura)
+                ingreds_minor = st.multiselect("Ingredientes Traço", lista_display)
 
             st.markdown("---")
             st.markdown("🔍 **Rastreadores Ocultos:**")
@@ -336,43 +761,124 @@ with aba_cadastros:
                 with cols_track[i % 4]:
                     if st.checkbox(t, key=f"rec_track_{t}"): trackers_selecionados.append(t)
             
-            if st.form_submit_button("Salvar Receita"):
-                if nome_rec and (ingreds_main or ingreds_minor):
-                    wb = conectar_google_sheets()
-                    _, sheet_rec = obter_receitas(wb)
-                    str_main = ",".join(ingreds_main)
-                    str_minor = ",".join(ingreds_minor)
-                    str_track = ",".join(trackers_selecionados)
-                    sheet_rec.append_row([nome_rec, str_main, str_minor, str_track])
-                    todos_novos = trackers_selecionados
-                    if todos_novos: verificar_e_criar_colunas(wb.sheet1, todos_novos)
+            if st.form_submit_button("Salvar Receita", disabled=somente_leitura):
+                ciclos = receitas_dict.ciclos_com(nome_rec, ingreds_main, ingreds_minor, trackers_selecionados) if nome_rec else []
+                if ciclos:
+                    st.error(f"Receita circular: {' → '.join(ciclos[0])}")
+                elif nome_rec and (ingreds_main or ingreds_minor):
+                    armazenamento = conectar_armazenamento()
+                    armazenamento.adicionar_receita(nome_rec, ingreds_main, ingreds_minor, trackers_selecionados)
+                    invalidar_cache("Receitas", "Dados")  # Dados: registros antigos do prato ganham os ingredientes
                     st.success(f"Receita '{nome_rec}' salva!")
-                    st.cache_data.clear()
                     st.rerun()
                 else: st.error("Preencha o nome.")
+            for ciclo in receitas_dict.ciclos:
+                st.warning(f"Receita circular ignorada na expansão: {' → '.join(ciclo)}")
+
+    # 3. Manutenção: migra registros antigos (uma coluna por alimento) para a coluna Consumo
+    if formato_largo_pendente():
+        with st.expander("🗜️ Compactar planilha (formato esparso)", expanded=False):
+            st.caption("Registros novos já são gravados só com o que foi consumido. Isto reescreve os antigos "
+                       "no mesmo formato e guarda uma cópia da aba original.")
+            pendentes = fila_envio().pendentes(USUARIO)
+            if pendentes: st.caption(f"Aguarde o envio dos {pendentes} registro(s) na fila.")
+            if st.button("Compactar agora", disabled=somente_leitura or bool(pendentes)):
+                with pausar_envio(): nome_backup = conectar_armazenamento().compactar_formato_longo()
+                forcar_recarga_completa()
+                st.success(f"✅ Planilha compactada. Backup em '{nome_backup}'.")
+                st.rerun()
+
+    # 4. Manutenção: anos fechados saem da aba de Dados para abas de arquivo (uma por ano)
+    anos_fechados = anos_para_arquivar() if obter_armazenamento().remoto else []  # Banco local é indexado: não precisa de arquivo
+    if anos_fechados:
+        with st.expander("🗄️ Arquivar anos anteriores", expanded=False):
+            st.caption(f"Move os registros de {', '.join(map(str, anos_fechados))} para abas de arquivo. Eles continuam nas "
+                       "análises, mas a aba de Dados fica só com os anos recentes e as recargas completas ficam leves.")
+            pendentes = fila_envio().pendentes(USUARIO)
+            if pendentes: st.caption(f"Aguarde o envio dos {pendentes} registro(s) na fila.")
+            if st.button("Arquivar agora", disabled=somente_leitura or bool(pendentes)):
+                with pausar_envio(): movidos = conectar_armazenamento().arquivar_anos(ano_limite_arquivo())
+                forcar_recarga_completa()
+                st.success("✅ Arquivado: " + ", ".join(f"{ano} ({n} registros)" for ano, n in movidos.items()))
+                st.rerun()
+
+    # 5. Banco local ainda vazio: traz o histórico da planilha do Google (uma vez só, senão duplicaria)
+    if BACKEND_ARMAZENAMENTO == "sqlite" and df.empty and tem_credenciais_google():
+        with st.expander("📥 Importar da planilha do Google", expanded=False):
+            st.caption(f"Copia registros (inclusive os anos arquivados), listas e receitas de '{nome_planilha(USUARIO)}' "
+                       "para o banco local.")
+            if st.button("Importar agora"):
+                with st.spinner("Importando..."):
+                    n = obter_armazenamento().importar_de(armazenamento_sheets(USUARIO), LISTA_ALIM_BACKUP, LISTA_SINT_BACKUP)
+                forcar_recarga_completa()
+                invalidar_cache("Config", "Receitas")
+                st.success(f"✅ {n} registros importados.")
+                st.rerun()
 
 # ==============================================================================
 # ABA: HISTÓRICO (Com funcionalidades restauradas)
 # ==============================================================================
-with aba_historico:
+# Fragmentos: trocar agrupamento ou página reexecuta só o trecho, não a aba inteira
+@st.fragment
+def grafico_medidas():
+    st.subheader("Evolução de Medidas")
+    agrupamento = st.radio("Agrupar por:", ["Automático", "Dia", "Semana"], horizontal=True)
+    df_medidas = derivado("medidas", df, (agrupamento,), lambda: serie_medidas(df, agrupamento))
+    if not df_medidas.empty: st.line_chart(df_medidas)
+    else: st.info("Sem dados de medidas.")
+
+@st.fragment
+def diario_de_bordo(dias_cubo):
+    cp1, cp2 = st.columns(2)
+    with cp1: dias_por_pagina = st.selectbox("Dias por página:", [7, 15, 30, 60, 90], index=2)
+    total_paginas = max(1, -(-len(dias_cubo) // dias_por_pagina))
+    with cp2: pagina = st.number_input(f"Página (de {total_paginas}):", 1, total_paginas, 1)
+    for dia, info in dias_cubo.iloc[(pagina - 1) * dias_por_pagina: pagina * dias_por_pagina].iterrows():
+        with st.container(border=True):
+            dia_semana = dia.strftime("%A")
+            dias_pt = {'Monday':'Seg', 'Tuesday':'Ter', 'Wednesday':'Qua', 'Thursday':'Qui', 'Friday':'Sex', 'Saturday':'Sáb', 'Sunday':'Dom'}
+            dia_str = dias_pt.get(dia_semana, dia_semana)
+            
+            st.markdown(f"### 🗓️ {dia.strftime('%d/%m/%Y')} ({dia_str})")
+            
+            # Resumo Bristol
+            bristols_dia = info['bristols']
+            if bristols_dia:
+                bristols_txt = ", ".join([str(int(b)) for b in bristols_dia])
+                cor_status = "red" if any(b >= 5 for b in bristols_dia) else "green"
+                st.markdown(f":{cor_status}[**Evacuações:** {len(bristols_dia)}x (Bristol: {bristols_txt})]")
+            
+            # Resumo Comida (Agrupado)
+            alimentos_dia = info['menu']
+            if alimentos_dia:
+                st.markdown(f"🍽️ **Menu:** {', '.join(alimentos_dia)}")
+
+            # Resumo Sintomas
+            sintomas_dia = info['sintomas']
+            if sintomas_dia: st.markdown(f"⚠️ **Sintomas:** {', '.join(sintomas_dia)}")
+            remedios_dia = info['remedios']
+            if remedios_dia: st.markdown(f"💊 **Remédios:** {', '.join(remedios_dia)}")
+
+            # Notas
+            notas_dia = info['notas']
+            if notas_dia: st.info("\n".join(notas_dia))
+
+def pagina_historico():
     # --- SEÇÃO 1: PANORAMA GERAL (RESTAURADA) ---
     st.header("Panorama Geral")
     
     if not df.empty:
+        # Cubo diário: montado uma vez por versão dos dados e usado pelas duas seções
+        itens_grafico = frozenset(lista_alim_pura + LISTA_RASTREADORES)
+        itens_menu = frozenset(lista_alim_pura + lista_display + LISTA_RASTREADORES)
+        cubo = derivado("cubo_diario", df, (itens_menu, itens_grafico), lambda: montar_cubo_diario(df, consumo, indice_marcas(df), itens_menu, itens_grafico))
+
         # Prepara dados para os gráficos
-        # 1. Contagem de Alimentos
-        contagem_alim = {}
-        cols_para_grafico = [c for c in df.columns if c in lista_alim_pura or c in LISTA_RASTREADORES]
-        for c in cols_para_grafico:
-            if c in df.columns:
-                dias_comido = df[df[c] >= 1]['Data'].nunique()
-                if dias_comido > 0: contagem_alim[c] = dias_comido
+        # 1. Contagem de Alimentos (dias distintos)
+        contagem_alim = {item: int(dias) for item, dias in cubo['dias_por_item'].items() if dias > 0}
         
         # 2. Contagem de Sintomas
-        todas_tags = []
-        for item in df['Características'].dropna():
-            tags = re.split(r'[,;]\s*|\s\s+', str(item))
-            todas_tags.extend([t.strip().capitalize() for t in tags if t.strip()])
+        sint_counts = derivado("sintomas", df, (), lambda: contar_sintomas(df, indice_marcas(df)['sintomas']))
         
         # --- Layout dos Gráficos ---
         tab_graf1, tab_graf2, tab_graf3 = st.tabs(["☁️ Nuvem & Frequência", "📉 Sintomas", "📏 Medidas"])
@@ -382,160 +888,223 @@ with aba_historico:
             with c_nuvem:
                 st.subheader("Nuvem de Alimentos")
                 if contagem_alim:
-                    wc = WordCloud(width=600, height=400, background_color='black', colormap='Pastel1').generate_from_frequencies(contagem_alim)
-                    fig, ax = plt.subplots(figsize=(6,4))
-                    fig.patch.set_facecolor('black')
-                    ax.imshow(wc)
-                    ax.axis('off')
-                    st.pyplot(fig)
+                    # Só regenera quando as contagens mudam
+                    st.image(artefato("nuvem", sorted(contagem_alim.items()), lambda: gerar_nuvem_png(contagem_alim)), use_container_width=True)
                 else: st.info("Sem dados de alimentos ainda.")
             
             with c_freq:
                 st.subheader("Top Alimentos (Dias)")
                 if contagem_alim:
-                    df_freq = pd.DataFrame(list(contagem_alim.items()), columns=['Alimento', 'Dias']).sort_values('Dias', ascending=False).head(15)
+                    df_freq = artefato("top_alimentos", sorted(contagem_alim.items()), lambda: pd.DataFrame(
+                        list(contagem_alim.items()), columns=['Alimento', 'Dias']).sort_values('Dias', ascending=False).head(15))
                     st.dataframe(df_freq, use_container_width=True, hide_index=True, column_config={"Dias": st.column_config.ProgressColumn(format="%d", max_value=int(df_freq['Dias'].max()))})
 
         with tab_graf2:
             st.subheader("Sintomas Mais Comuns")
-            if todas_tags:
-                df_sint = pd.DataFrame(todas_tags, columns=['Sintoma'])
-                sint_counts = df_sint['Sintoma'].value_counts().reset_index()
-                sint_counts.columns = ['Sintoma', 'Qtd']
-                sint_counts['%'] = (sint_counts['Qtd'] / len(df)) * 100
+            if not sint_counts.empty:
                 st.dataframe(sint_counts.head(15), column_config={"%": st.column_config.ProgressColumn(format="%.1f%%", min_value=0, max_value=100)}, use_container_width=True, hide_index=True)
             else: st.info("Sem sintomas registrados.")
         
-        with tab_graf3:
-            st.subheader("Evolução de Medidas")
-            df_medidas = df.copy().set_index('DataHora').sort_index()
-            cols_plot = []
-            if 'Circunferencia_Cintura' in df_medidas.columns: cols_plot.append('Circunferencia_Cintura')
-            if 'Circunferencia_Abdominal' in df_medidas.columns: cols_plot.append('Circunferencia_Abdominal')
-            if cols_plot: st.line_chart(df_medidas[cols_plot].replace(0, None))
-            else: st.info("Sem dados de medidas.")
+        with tab_graf3: grafico_medidas()
 
     st.divider()
 
     # --- SEÇÃO 2: DIÁRIO DE BORDO (Card Diário) ---
     st.header("Diário de Bordo (Detalhado)")
-    if not df.empty:
-        dias_unicos = sorted(df['DataHora'].dt.date.unique(), reverse=True)
-        for dia in dias_unicos[:30]: # Limite de 30 dias para não pesar
-            df_dia = df[df['DataHora'].dt.date == dia]
-            with st.container(border=True):
-                dia_semana = dia.strftime("%A")
-                dias_pt = {'Monday':'Seg', 'Tuesday':'Ter', 'Wednesday':'Qua', 'Thursday':'Qui', 'Friday':'Sex', 'Saturday':'Sáb', 'Sunday':'Dom'}
-                dia_str = dias_pt.get(dia_semana, dia_semana)
-                
-                st.markdown(f"### 🗓️ {dia.strftime('%d/%m/%Y')} ({dia_str})")
-                
-                # Resumo Bristol
-                bristols_dia = df_dia[df_dia['Escala de Bristol'] > 0]['Escala de Bristol'].tolist()
-                if bristols_dia:
-                    bristols_txt = ", ".join([str(int(b)) for b in bristols_dia])
-                    cor_status = "red" if any(b >= 5 for b in bristols_dia) else "green"
-                    st.markdown(f":{cor_status}[**Evacuações:** {len(bristols_dia)}x (Bristol: {bristols_txt})]")
-                
-                # Resumo Comida (Agrupado)
-                alimentos_dia = set()
-                for col in df.columns:
-                    if (col in lista_alim_pura or col in lista_display or col in LISTA_RASTREADORES):
-                        if df_dia[col].sum() > 0:
-                            alimentos_dia.add(col)
-                if alimentos_dia:
-                    st.markdown(f"🍽️ **Menu:** {', '.join(sorted(list(alimentos_dia)))}")
-
-                # Resumo Sintomas
-                sintomas_dia = []
-                for s in df_dia['Características']:
-                    if s: sintomas_dia.extend(s.split(','))
-                sintomas_dia = list(set([x.strip() for x in sintomas_dia if x.strip()]))
-                if sintomas_dia: st.markdown(f"⚠️ **Sintomas:** {', '.join(sintomas_dia)}")
-
-                # Notas
-                notas_dia = [n for n in df_dia['Notas'] if n]
-                if notas_dia: st.info("\n".join(notas_dia))
+    if not df.empty: diario_de_bordo(cubo['dias'])
 
 # ==============================================================================
 # ABA: DETETIVE (ALGORITMO COMPLETO)
 # ==============================================================================
-with aba_analise:
+# Fragmentos: trocar o item do perfil ou o tamanho das combinações não refaz a análise inteira
+@st.fragment
+def perfil_item(resultado, df_res, janela_dias):
+    perfil = resultado['perfil']
+    st.subheader("📈 Perfil por Janela")
+    suspeitos = df_res.sort_values(by="RR", ascending=False)['Item'].tolist()
+    item_perfil = st.selectbox("Item:", suspeitos)
+    curva = perfil[perfil['item'] == item_perfil].set_index('lag')
+    curva = pd.DataFrame({"Com o item": curva['risco'], "IC inferior": curva['risco_inf'], "IC superior": curva['risco_sup'],
+                          "Sem o item": curva['risco_sem']}) * 100
+    st.line_chart(curva, x_label="Janela (dias)", y_label="Risco de crise (%)")
+
+    dose = resultado['dose']
+    dose = dose[(dose['item'] == item_perfil) & (dose['lag'] == janela_dias)]
+    st.dataframe(pd.DataFrame({"Nível": dose['nivel'], "Dias": dose['dias'], "Crises": dose['crises'], "Risco %": dose['risco'] * 100}),
+                 hide_index=True, column_config={"Risco %": st.column_config.NumberColumn(format="%.1f")})
+
+@st.fragment
+def tabela_combinacoes(crise, janela_dias, valor_minimo_considerado, min_consumo, correcao, risco_janela, rodar):
+    st.caption("Dias em que os itens aparecem juntos (mesma janela e filtros). Sinergia > 1: a combinação "
+               "provoca mais crises que o pior item dela sozinho. Só entram combinações com o mínimo de dias consumidos.")
+    tamanho_maximo = st.radio("Combinações de até:", [2, 3], format_func=lambda n: f"{n} itens", horizontal=True)
+    rodar_comb = st.button("🔗 Calcular combinações") if tamanho_maximo > 2 else False
+    df_comb = analisar_combinacoes(df, consumo, itens_analise, crise, janela_dias, valor_minimo_considerado,
+                                   min_consumo, tamanho_maximo, correcao, somente_cache=not (rodar or rodar_comb))
+    if df_comb is None:
+        st.info("Combinação de filtros fora do pré-cálculo: clique em 🔍 Rodar Detetive" + (" ou 🔗 Calcular combinações." if tamanho_maximo > 2 else "."))
+    elif df_comb[df_comb['risco'] > risco_janela].empty:
+        st.info("Nenhuma combinação frequente acima do risco basal com esses filtros.")
+    else:
+        df_comb = df_comb[df_comb['risco'] > risco_janela]
+        st.dataframe(pd.DataFrame({
+            "Combinação": df_comb['itens'], "Dias": df_comb['dias'], "Risco %": df_comb['risco'] * 100,
+            "Pior item sozinho %": df_comb['risco_individual'] * 100, "Sinergia": df_comb['sinergia'], "RR": df_comb['rr'],
+            "IC 95% RR": [f"{a:.2f} – {b:.2f}" for a, b in zip(df_comb['rr_inf'], df_comb['rr_sup'])],
+            "p ajust.": df_comb['p_ajustado']}).sort_values(by=["Sinergia", "RR"], ascending=False).head(30),
+            use_container_width=True, hide_index=True,
+            column_config={"Risco %": st.column_config.NumberColumn(format="%.1f"), "Pior item sozinho %": st.column_config.NumberColumn(format="%.1f"),
+                           "Sinergia": st.column_config.NumberColumn(format="%.2f"), "RR": st.column_config.NumberColumn(format="%.2f"),
+                           "p ajust.": st.column_config.NumberColumn(format="%.3f")})
+
+def pagina_analise():
     st.header("Análise de Risco (Porto Seguro)")
     st.info("Este algoritmo ignora os primeiros 3 dias de registro para criar a janela de segurança.")
     
     col1, col2, col3 = st.columns(3)
-    with col1: janela_dias = st.slider("Janela de Efeito (dias):", 0, 3, 1)
+    with col1:
+        janela_dias = st.slider("Janela de Efeito (dias):", 0, LAG_MAXIMO, 1)
+        tipo_correcao = st.selectbox("Correção p/ múltiplos testes:", ["FDR (Benjamini-Hochberg)", "Bonferroni", "Nenhuma"])
     with col2:
-        filtro_qtd = st.selectbox("Quantidade Consumida?", ["Todas (1, 2, 3)", "Só Exageros (3)", "Normal e Exagero (2, 3)"])
-        min_consumo = st.number_input("Mínimo de dias consumidos:", 1, value=4)
-    with col3: tipo_analise = st.selectbox("Investigar Crise:", ["🚨 Diarreia Aguda (Bristol 7)", "Diarreia Geral (Bristol >= 5)"])
+        filtro_qtd = st.selectbox("Quantidade Consumida?", list(FILTROS_QTD))
+        min_consumo = st.number_input("Mínimo de dias consumidos:", 1, value=MIN_DIAS_PADRAO)
+    with col3:
+        # Além do Bristol, cada sintoma registrado pode ser investigado como "crise"
+        sintomas_registrados = [] if df.empty else derivado("sintomas", df, (), lambda: contar_sintomas(df, indice_marcas(df)['sintomas']))['Sintoma']
+        opcoes_crise = {**TIPOS_CRISE, **{f"⚠️ Sintoma: {s}": s for s in sintomas_registrados}}
+        tipo_analise = st.selectbox("Investigar Crise:", list(opcoes_crise))
+        tipo_ic = st.selectbox("Intervalo do Risco Relativo:", ["Log-normal (rápido)", "Bootstrap (1000 amostras)"])
+
+    # Filtros padrão vêm prontos do pré-cálculo; o botão calcula na hora os demais
+    rodar = st.button("🔍 Rodar Detetive", help="Calcula agora combinações de filtros que não estão pré-calculadas.")
+    precalculo = status_precalculo(df)
+    if precalculo and precalculo['erro']:
+        st.warning(f"Pré-cálculo interrompido: {precalculo['erro']}")
+    elif precalculo and precalculo['fim'] is None:
+        st.progress(precalculo['feitos'] / precalculo['total'], text=f"⏳ Pré-calculando para os dados atuais ({precalculo['feitos']}/{precalculo['total']})...")
+    elif precalculo:
+        st.caption(f"⚡ Tabelas pré-calculadas às {precalculo['fim']:%H:%M:%S} para os dados atuais.")
+
+    if df.empty:
+        st.error("Sem dados para analisar.")
+    else:
+        # 1. Filtra apenas os dias seguros (PORTO SEGURO)
+        # A coluna 'Porto_Seguro' já foi calculada no carregamento com a janela de 3 dias
+        df_analise = df[df['Porto_Seguro'] == True]
+        
+        # 2. Define o que é crise
+        crise = opcoes_crise[tipo_analise]
+        df_crises = df[mascara_crise(df, crise)]
+        if isinstance(crise, str): st.caption(f"Crise = registro com '{crise}'. O Porto Seguro continua definido pelo Bristol (>= 5).")
+
+        # 3. Lógica de Quantidade
+        valor_minimo_considerado = FILTROS_QTD[filtro_qtd]
+
+        # 4. Taxa Basal
+        total_dias_registro = df_analise['Data'].nunique()
+        dias_com_crise_apos_porto = df_crises[df_crises['Porto_Seguro'] == True]['Data'].nunique()
+        risco_basal = (dias_com_crise_apos_porto / total_dias_registro) if total_dias_registro > 0 else 0
 
-    if st.button("🔍 Rodar Detetive"):
-        if df.empty:
-            st.error("Sem dados para analisar.")
+        # 5. Análise de Itens (todas as janelas de uma vez)
+        correcao = {"FDR (Benjamini-Hochberg)": 'fdr', "Bonferroni": 'bonferroni'}.get(tipo_correcao, 'nenhuma')
+        resultado = analisar_gatilhos(df, consumo, itens_analise, crise, valor_minimo_considerado,
+                                      min_consumo, correcao, 1000 if "Bootstrap" in tipo_ic else 0, somente_cache=not rodar)
+        if resultado is None:
+            if precalculo and precalculo['fim'] is None and not precalculo['erro']:
+                st.info("⏳ Pré-cálculo em andamento: atualize em instantes ou clique em 🔍 Rodar Detetive.")
+            else: st.info("Clique em 🔍 Rodar Detetive para calcular com esses filtros.")
         else:
-            # 1. Filtra apenas os dias seguros (PORTO SEGURO)
-            # A coluna 'Porto_Seguro' já foi calculada no carregamento com a janela de 3 dias
-            df_analise = df[df['Porto_Seguro'] == True].copy()
-            
-            # 2. Define o que é crise
-            if "Bristol 7" in tipo_analise:
-                df_crises = df[df['Escala de Bristol'] == 7]
-            else:
-                df_crises = df[df['Escala de Bristol'] >= 5]
-
-            # 3. Lógica de Quantidade
-            valor_minimo_considerado = 1
-            if filtro_qtd == "Só Exageros (3)": valor_minimo_considerado = 3
-            elif filtro_qtd == "Normal e Exagero (2, 3)": valor_minimo_considerado = 2
-
-            # 4. Taxa Basal
-            total_dias_registro = df_analise['Data'].nunique()
-            dias_com_crise_apos_porto = df_crises[df_crises['Porto_Seguro'] == True]['Data'].nunique()
-            risco_basal = (dias_com_crise_apos_porto / total_dias_registro) if total_dias_registro > 0 else 0
-            
-            st.metric("Taxa Basal (em Porto Seguro)", f"{risco_basal:.1%}")
-
-            # 5. Análise de Itens
-            # Analisa apenas Alimentos Puros e Rastreadores (Ingredientes), não nomes de pratos
-            itens_analise = sorted(list(set(lista_alim_pura + LISTA_RASTREADORES)))
-
-            tabela = []
-            for item in itens_analise:
-                # Verifica se o item existe nas colunas e é numérico
-                if item in df_analise.columns and pd.api.types.is_numeric_dtype(df_analise[item]):
-                    # Filtra dias onde comeu esse item na quantidade selecionada
-                    mask_comeu = df_analise[item] >= valor_minimo_considerado
-                    total_consumo_dias = int(df_analise[mask_comeu]['Data'].nunique())
-                    
-                    if total_consumo_dias < min_consumo: continue
-                    
-                    # Verifica crises nos dias seguintes
-                    datas_consumo = df_analise[mask_comeu]['DataHora'].dt.date.unique()
-                    vezes_gatilho = 0
-                    
-                    for data_c in datas_consumo:
-                        dt = pd.to_datetime(data_c)
-                        # Janela de análise
-                        fim = dt.replace(hour=23, minute=59) if janela_dias == 0 else dt + timedelta(days=janela_dias)
-                        
-                        # Verifica se houve crise nesse intervalo
-                        if df_crises[(df_crises['DataHora'] > dt) & (df_crises['DataHora'] <= fim)].shape[0] > 0:
-                            vezes_gatilho += 1
-                    
-                    risco = min(1.0, vezes_gatilho / total_consumo_dias)
-                    impacto = risco / risco_basal if risco_basal > 0 else 0
-                    tabela.append({"Item": item, "Dias": total_consumo_dias, "Segurança %": (1-risco)*100, "Impacto": impacto})
-
-            if tabela:
-                df_res = pd.DataFrame(tabela)
-                c1, c2 = st.columns(2)
-                with c1:
-                    st.subheader("✅ Mais Seguros")
-                    st.dataframe(df_res.sort_values(by="Segurança %", ascending=False).head(15), use_container_width=True)
-                with c2:
-                    st.subheader("⚠️ Maiores Suspeitos (Impacto)")
-                    st.dataframe(df_res[df_res['Impacto'] > 1.0].sort_values(by="Impacto", ascending=False).head(15), use_container_width=True)
-            else:
-                st.info("Sem dados suficientes com esses filtros.")
\ No newline at end of file
+            risco_janela = resultado['basal'].get(janela_dias, 0)
+            m1, m2 = st.columns(2)
+            m1.metric("Taxa Basal (em Porto Seguro)", f"{risco_basal:.1%}")
+            m2.metric(f"Risco de crise em {janela_dias} dia(s), qualquer dia", f"{risco_janela:.1%}")
+
+            perfil = resultado['perfil']
+            sel = perfil[(perfil['lag'] == janela_dias) & (perfil['dias'] >= min_consumo)]
+            df_res = pd.DataFrame({
+                "Item": sel['item'], "Dias": sel['dias'], "Segurança %": (1 - sel['risco']) * 100,
+                "Impacto": sel['risco'] / risco_basal if risco_basal > 0 else 0,
+                "RR": sel['rr'], "IC 95% RR": [f"{a:.2f} – {b:.2f}" for a, b in zip(sel['rr_inf'], sel['rr_sup'])],
+                "p ajust.": sel['p_ajustado'], "Dose (p)": sel['p_dose']})
+            formato = {"Segurança %": st.column_config.NumberColumn(format="%.1f"), "Impacto": st.column_config.NumberColumn(format="%.2f"),
+                       "RR": st.column_config.NumberColumn(format="%.2f"), "p ajust.": st.column_config.NumberColumn(format="%.3f"),
+                       "Dose (p)": st.column_config.NumberColumn(format="%.3f")}
+
+            sub_itens, sub_combos = st.tabs(["🧪 Itens", "🔗 Combinações"])
+            with sub_itens:
+                if not df_res.empty:
+                    c1, c2 = st.columns(2)
+                    with c1:
+                        st.subheader("✅ Mais Seguros")
+                        st.dataframe(df_res.sort_values(by="Segurança %", ascending=False).head(15), use_container_width=True, hide_index=True, column_config=formato)
+                    with c2:
+                        st.subheader("⚠️ Maiores Suspeitos (Risco Relativo)")
+                        st.dataframe(df_res[df_res['RR'] > 1.0].sort_values(by=["p ajust.", "RR"], ascending=[True, False]).head(15),
+                                     use_container_width=True, hide_index=True, column_config=formato)
+                    st.caption("RR = risco de crise nos dias com o item ÷ risco nos dias sem ele. IC 95% que não cruza 1 e "
+                               "p ajustado < 0,05 indicam associação consistente; 'Dose (p)' testa se o risco sobe com o nível 1→2→3.")
+
+                    # 6. Perfil por janela e dose-resposta de um item
+                    perfil_item(resultado, df_res, janela_dias)
+                else:
+                    st.info("Sem dados suficientes com esses filtros.")
+
+            with sub_combos: tabela_combinacoes(crise, janela_dias, valor_minimo_considerado, min_consumo, correcao, risco_janela, rodar)
+
+# ==============================================================================
+# NAVEGAÇÃO
+# ==============================================================================
+pagina_ativa = st.navigation([st.Page(pagina_diario, title="Diário", icon="📝", url_path="diario", default=True),
+                              st.Page(pagina_cadastros, title="Cadastros", icon="⚙️", url_path="cadastros"),
+                              st.Page(pagina_historico, title="Histórico", icon="🗂️", url_path="historico"),
+                              st.Page(pagina_analise, title="Detetive", icon="📊", url_path="detetive")], position="top")
+with etapa(f"Página {pagina_ativa.title}"): pagina_ativa.run()
+
+# ==============================================================================
+# PAINEL DE DESEMPENHO (oculto: abrir com ?debug=1 na URL)
+# ==============================================================================
+if CAMINHO_PERFIL: medidor.exportar(CAMINHO_PERFIL)
+if st.query_params.get("debug"):
+    with st.sidebar, st.expander("🐞 Desempenho deste rerun", expanded=True):
+        resumo = medidor.resumo()
+        st.caption(f"⏱️ Total: {resumo['total'] * 1000:.0f} ms")
+        if resumo['etapas']:
+            # Cascata: cada barra vai do início ao fim da etapa; etapas internas vêm recuadas
+            etapas = pd.DataFrame(resumo['etapas'])
+            etapas['Etapa'] = [f"{i:02d} {'· ' * nivel}{nome}" for i, (nivel, nome) in enumerate(zip(etapas['nivel'], etapas['nome']))]
+            etapas['Início (ms)'] = etapas['inicio'] * 1000
+            etapas['Fim (ms)'] = (etapas['inicio'] + etapas['duracao'].fillna(0)) * 1000
+            etapas['Duração (ms)'] = etapas['duracao'] * 1000
+            st.vega_lite_chart(etapas[['Etapa', 'Início (ms)', 'Fim (ms)', 'Duração (ms)']], {
+                'mark': 'bar', 'encoding': {
+                    'y': {'field': 'Etapa', 'type': 'nominal', 'sort': None, 'title': None},
+                    'x': {'field': 'Início (ms)', 'type': 'quantitative'}, 'x2': {'field': 'Fim (ms)'},
+                    'tooltip': [{'field': 'Etapa'}, {'field': 'Duração (ms)', 'type': 'quantitative', 'format': '.0f'}]}},
+                use_container_width=True)
+
+        api = contador_api()
+        minuto = api.ultimo_minuto()
+        st.caption(f"🌐 Último minuto: {minuto['leitura']} leituras, {minuto['escrita']} escritas, "
+                   f"{minuto['respostas_429']} respostas 429 (cota: {COTA_LEITURAS_MINUTO} leituras e {COTA_ESCRITAS_MINUTO} escritas/min)")
+        limite = limitador_api().estatisticas
+        st.caption(f"🚦 Limitador: {limite['coalescidas']} leituras coalescidas, {limite['repeticoes']} repetições, "
+                   f"{limite['espera_cota']:.1f}s esperando cota, {limite['espera_repeticao']:.1f}s em espera exponencial")
+        if resumo['chamadas']:
+            chamadas = pd.DataFrame(resumo['chamadas'])
+            st.dataframe(pd.DataFrame({"Chamada": chamadas['operacao'], "Status": chamadas['status'], "Início (ms)": chamadas['inicio'] * 1000,
+                                       "Latência (ms)": chamadas['duracao'] * 1000, "KB recebidos": chamadas['recebidos'] / 1024}),
+                         hide_index=True, use_container_width=True,
+                         column_config={c: st.column_config.NumberColumn(format="%.0f") for c in ["Início (ms)", "Latência (ms)"]} |
+                                       {"KB recebidos": st.column_config.NumberColumn(format="%.1f")})
+        else: st.caption("Nenhuma chamada ao Google neste rerun (tudo veio do cache).")
+        totais = api.resumo()
+        if totais:
+            st.caption("Totais do processo (todas as sessões e threads de fundo):")
+            totais = pd.DataFrame.from_dict(totais, orient='index').rename_axis('Chamada').reset_index()
+            st.dataframe(pd.DataFrame({"Chamada": totais['Chamada'], "Tipo": totais['tipo'], "Qtd": totais['chamadas'],
+                                       "Latência média (ms)": totais['segundos'] / totais['chamadas'] * 1000,
+                                       "KB enviados": totais['enviados'] / 1024, "KB recebidos": totais['recebidos'] / 1024,
+                                       "429": totais['respostas_429']}).sort_values("Qtd", ascending=False),
+                         hide_index=True, use_container_width=True,
+                         column_config={c: st.column_config.NumberColumn(format="%.1f") for c in ["Latência média (ms)", "KB enviados", "KB recebidos"]})
+        if CAMINHO_PERFIL: st.caption(f"💾 Medições gravadas em {CAMINHO_PERFIL}")
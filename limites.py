@@ -0,0 +1,151 @@
+"""Uso da API do Google dentro da cota, compartilhado por todas as sessões do processo.
+
+`LimitadorAPI.envolver(cliente)` coloca na frente das requisições HTTP do gspread:
+- um balde de fichas global por tipo (leituras/escritas por minuto), que faz as sessões
+  esperarem a vez em vez de estourar a cota;
+- coalescência de leituras: GETs idênticos em andamento viram uma requisição só, e a
+  resposta vale por `validade_leitura` segundos (até a próxima escrita);
+- repetição com espera exponencial e jitter em 429 (e 5xx/rede nas leituras).
+"""
+
+import random
+import threading
+import time
+
+import requests
+from gspread.exceptions import APIError
+
+
+class BaldeFichas:
+    """`por_minuto` fichas por minuto, acumulando até `capacidade` (rajada)."""
+
+    def __init__(self, por_minuto, capacidade=None):
+        self.taxa = por_minuto / 60.0
+        self.capacidade = capacidade or max(1, por_minuto // 4)
+        self._fichas = float(self.capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def retirar(self):
+        """Bloqueia até haver ficha; retorna quanto esperou (s)."""
+        esperado = 0.0
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return esperado
+                falta = (1 - self._fichas) / self.taxa
+            time.sleep(falta)
+            esperado += falta
+
+
+class _Pendente:
+    """Leitura em andamento que outras threads aguardam em vez de repetir."""
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.resposta = None
+        self.erro = None
+
+
+class LimitadorAPI:
+    """Balde de fichas + coalescência + repetição para um cliente gspread (ver docstring do módulo)."""
+
+    def __init__(self, leituras_por_minuto=60, escritas_por_minuto=60, tentativas=5, espera_inicial=1.0, espera_maxima=32.0,
+                 validade_leitura=2.0):
+        self.baldes = {'leitura': BaldeFichas(leituras_por_minuto), 'escrita': BaldeFichas(escritas_por_minuto)}
+        self.tentativas = tentativas
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.validade_leitura = validade_leitura
+        self._lock = threading.Lock()
+        self._respostas = {}  # chave -> (momento, resposta)
+        self._pendentes = {}
+        self._geracao = 0  # Sobe a cada escrita: leitura iniciada antes não entra no cache
+        self.estatisticas = {'coalescidas': 0, 'repeticoes': 0, 'espera_cota': 0.0, 'espera_repeticao': 0.0}
+
+    def envolver(self, cliente):
+        http = getattr(cliente, 'http_client', cliente)  # gspread >= 6 / 5.x
+        original = getattr(http, 'request', None)
+        if original is None or getattr(original, 'limitado', False): return cliente
+
+        def request(metodo, url, *args, **kwargs):
+            if metodo.upper() != 'GET': return self._escrever(original, metodo, url, *args, **kwargs)
+            return self._ler(original, metodo, url, *args, **kwargs)
+
+        request.limitado = True
+        http.request = request
+        return cliente
+
+    def _ler(self, original, metodo, url, *args, **kwargs):
+        chave = (url, repr(args), repr(sorted(kwargs.items())))
+        with self._lock:
+            # Respostas vencidas saem aqui: o cache guarda só as leituras dos últimos `validade_leitura` segundos
+            agora = time.monotonic()
+            self._respostas = {k: r for k, r in self._respostas.items() if agora - r[0] < self.validade_leitura}
+            recente = self._respostas.get(chave)
+            if recente:
+                self.estatisticas['coalescidas'] += 1
+                return recente[1]
+            pendente = self._pendentes.get(chave)
+            dono = pendente is None
+            if dono: pendente = self._pendentes[chave] = _Pendente()
+            else: self.estatisticas['coalescidas'] += 1
+            geracao = self._geracao
+
+        if not dono:
+            pendente.pronto.wait()
+            if pendente.erro is not None: raise pendente.erro
+            return pendente.resposta
+
+        try:
+            pendente.resposta = self._com_repeticao('leitura', original, metodo, url, *args, **kwargs)
+            return pendente.resposta
+        except Exception as e:
+            pendente.erro = e
+            raise
+        finally:
+            with self._lock:
+                self._pendentes.pop(chave, None)
+                if pendente.erro is None and geracao == self._geracao:
+                    self._respostas[chave] = (time.monotonic(), pendente.resposta)
+            pendente.pronto.set()
+
+    def _escrever(self, original, metodo, url, *args, **kwargs):
+        with self._lock:
+            self._geracao += 1
+            self._respostas.clear()
+        try:
+            return self._com_repeticao('escrita', original, metodo, url, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._geracao += 1
+                self._respostas.clear()
+
+    def _com_repeticao(self, tipo, original, *args, **kwargs):
+        for tentativa in range(self.tentativas):
+            espera_cota = self.baldes[tipo].retirar()
+            try:
+                with self._lock: self.estatisticas['espera_cota'] += espera_cota
+                return original(*args, **kwargs)
+            except APIError as e:
+                # 429 = cota; 5xx só nas leituras (uma escrita pode ter sido aplicada)
+                repetir = e.code == 429 or (tipo == 'leitura' and e.code >= 500)
+                if not repetir or tentativa == self.tentativas - 1: raise
+                espera = self._espera(tentativa, getattr(e, 'response', None))
+            except (requests.ConnectionError, requests.Timeout):
+                if tipo != 'leitura' or tentativa == self.tentativas - 1: raise
+                espera = self._espera(tentativa, None)
+            with self._lock:
+                self.estatisticas['repeticoes'] += 1
+                self.estatisticas['espera_repeticao'] += espera
+            time.sleep(espera)
+
+    def _espera(self, tentativa, resposta):
+        """Espera exponencial com jitter total; respeita Retry-After quando a API informa."""
+        pedido = getattr(resposta, 'headers', {}).get('Retry-After')
+        if pedido and str(pedido).isdigit(): return min(float(pedido), self.espera_maxima)
+        return random.uniform(0, min(self.espera_maxima, self.espera_inicial * 2 ** tentativa))
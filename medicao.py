@@ -0,0 +1,149 @@
+"""Medição de desempenho: tempo das etapas de cada rerun e contabilidade das chamadas ao Google.
+
+`etapa(nome)` mede um trecho do rerun em andamento (fora de um rerun medido, como nas
+threads de fundo, só executa o trecho). As requisições HTTP do gspread passam por
+`instrumentar_cliente` e vão para o `ContadorAPI` do processo e para o rerun em andamento.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+JANELA_COTA = 60.0  # A cota do Sheets é contada por minuto
+_local = threading.local()
+
+
+class Medidor:
+    """Linha do tempo de um rerun: etapas (aninhadas) e chamadas de API, relativas ao início."""
+
+    def __init__(self):
+        self.quando = time.time()
+        self.inicio = time.perf_counter()
+        self.etapas = []  # [nome, nivel, inicio, duracao] em segundos
+        self.chamadas = []
+        self._nivel = 0
+
+    def ativar(self):
+        """Passa a receber as etapas e chamadas feitas nesta thread (a do script)."""
+        _local.medidor = self
+        return self
+
+    @contextmanager
+    def etapa(self, nome):
+        registro = [nome, self._nivel, time.perf_counter() - self.inicio, None]
+        self.etapas.append(registro)
+        self._nivel += 1
+        try:
+            yield
+        finally:
+            self._nivel -= 1
+            registro[3] = time.perf_counter() - self.inicio - registro[2]
+
+    def total(self):
+        return time.perf_counter() - self.inicio
+
+    def resumo(self):
+        """Dicionário serializável (uma linha do JSONL)."""
+        return {'quando': self.quando, 'total': self.total(),
+                'etapas': [{'nome': n, 'nivel': v, 'inicio': i, 'duracao': d} for n, v, i, d in self.etapas],
+                'chamadas': list(self.chamadas)}
+
+    def exportar(self, caminho):
+        with open(caminho, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.resumo(), ensure_ascii=False) + "\n")
+
+
+def medidor_atual():
+    return getattr(_local, 'medidor', None)
+
+
+@contextmanager
+def etapa(nome):
+    medidor = medidor_atual()
+    if medidor is None:
+        yield
+        return
+    with medidor.etapa(nome):
+        yield
+
+
+def _operacao(metodo, url):
+    """Nome curto da chamada: 'GET values:batchGet', 'POST values:append', 'GET metadados'..."""
+    caminho = url.split('?')[0]
+    sufixo = re.search(r':([a-z]\w+)$', caminho)  # Intervalos vêm codificados (%3A): só sobra o método
+    if 'drive' in caminho: nome = 'drive'
+    elif '/values' in caminho: nome = 'values' + (f":{sufixo.group(1)}" if sufixo else "")
+    else: nome = sufixo.group(1) if sufixo else 'metadados'
+    return f"{metodo.upper()} {nome}"
+
+
+def _bytes_enviados(args, kwargs):
+    corpo = dict(zip(('params', 'data', 'json'), args), **kwargs)
+    if corpo.get('json') is not None: return len(json.dumps(corpo['json']).encode())
+    return len(corpo.get('data') or b'')
+
+
+class ContadorAPI:
+    """Totais do processo por operação: chamadas, bytes, latência e respostas 429 (cota estourada)."""
+
+    def __init__(self, recentes=1000):
+        self._lock = threading.Lock()
+        self.totais = {}
+        self.recentes = deque(maxlen=recentes)
+
+    def registrar(self, metodo, url, enviados, recebidos, duracao, status):
+        chamada = {'quando': time.time(), 'operacao': _operacao(metodo, url),
+                   'tipo': 'leitura' if metodo.upper() == 'GET' else 'escrita',
+                   'enviados': enviados, 'recebidos': recebidos, 'duracao': duracao, 'status': status}
+        with self._lock:
+            total = self.totais.setdefault(chamada['operacao'], {'tipo': chamada['tipo'], 'chamadas': 0, 'enviados': 0,
+                                                                 'recebidos': 0, 'segundos': 0.0, 'respostas_429': 0})
+            total['chamadas'] += 1
+            total['enviados'] += enviados
+            total['recebidos'] += recebidos
+            total['segundos'] += duracao
+            total['respostas_429'] += status == 429
+            self.recentes.append(chamada)
+        medidor = medidor_atual()
+        if medidor is not None:
+            medidor.chamadas.append({**chamada, 'inicio': time.perf_counter() - medidor.inicio - duracao})
+
+    def ultimo_minuto(self):
+        """{'leitura': n, 'escrita': n, 'respostas_429': n} nos últimos JANELA_COTA segundos."""
+        limite = time.time() - JANELA_COTA
+        contagem = {'leitura': 0, 'escrita': 0, 'respostas_429': 0}
+        with self._lock:
+            for chamada in self.recentes:
+                if chamada['quando'] < limite: continue
+                contagem[chamada['tipo']] += 1
+                contagem['respostas_429'] += chamada['status'] == 429
+        return contagem
+
+    def resumo(self):
+        with self._lock: return {operacao: dict(total) for operacao, total in self.totais.items()}
+
+
+def instrumentar_cliente(cliente, contador):
+    """Faz toda requisição HTTP do `cliente` gspread passar pelo `contador`. Devolve o próprio cliente."""
+    http = getattr(cliente, 'http_client', cliente)  # gspread >= 6 / 5.x
+    original = getattr(http, 'request', None)
+    if original is None or getattr(original, 'medido', False): return cliente
+
+    def request(metodo, url, *args, **kwargs):
+        inicio, resposta = time.perf_counter(), None
+        try:
+            resposta = original(metodo, url, *args, **kwargs)
+            return resposta
+        except Exception as e:
+            resposta = getattr(e, 'response', None)  # APIError guarda a resposta (ex: 429)
+            raise
+        finally:
+            contador.registrar(metodo, url, _bytes_enviados(args, kwargs), len(getattr(resposta, 'content', None) or b''),
+                               time.perf_counter() - inicio, getattr(resposta, 'status_code', None))
+
+    request.medido = True
+    http.request = request
+    return cliente
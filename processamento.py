@@ -0,0 +1,263 @@
+"""Processamento dos dados do diário, sem Streamlit: tipagem das linhas da planilha, Porto
+Seguro, consumo em formato longo e agregados do Histórico.
+
+Funções puras sobre DataFrames: o app as chama através dos caches dele (`ler_com_cache`,
+`derivado`), e scripts de análise ou medição podem importá-las diretamente.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from armazenamento import COLUNA_CONSUMO, COLUNA_ENVIO, COLUNAS_LEGADO
+from medicao import etapa
+
+# Tipos em memória das colunas da aba de Dados (as demais ficam texto); níveis de consumo são int8
+ESQUEMA_DADOS = {'Escala de Bristol': 'int8', 'Diarreia': 'category', 'Características': 'category', 'Remédios': 'category',
+                 'Humor': 'category', 'Circunferencia_Cintura': 'float32', 'Circunferencia_Abdominal': 'float32'}
+FORMATO_DATA_HORA = "%d/%m/%Y %H:%M"  # Como o formulário grava; outros formatos caem na leitura flexível
+BLOCO_LINHAS = 4096  # Linhas por bloco na conversão das colunas largas antigas
+SEPARADOR_MARCAS = re.compile(r'[,;]\s*|\s\s+')  # "Gases, Cólica" / "Gases; Cólica" em Características e Remédios
+
+
+# --- INGESTÃO (linhas brutas da planilha -> registros tipados + consumo em formato longo) ---
+
+def consumo_vazio():
+    return pd.DataFrame({'Registro': pd.Series(dtype='int32'), 'item': pd.Series(dtype='category'), 'nivel': pd.Series(dtype='int8')})
+
+def _numeros(valores):
+    """Strings -> float (inválido vira NaN), convertendo cada valor distinto uma vez só."""
+    codigos, distintos = pd.factorize(np.asarray(valores, dtype=object).ravel(), use_na_sentinel=False)
+    return pd.to_numeric(pd.Series(distintos, dtype=object), errors='coerce').to_numpy(dtype=float)[codigos]
+
+def _extrair_consumo(registros, bruto, indices_itens, cols_itens, coluna_consumo):
+    """Formato longo (Registro, item, nivel) a partir das colunas largas antigas e da coluna Consumo.
+
+    As colunas largas (`indices_itens` na matriz `bruto`) são convertidas em blocos de
+    BLOCO_LINHAS linhas, uma chamada por bloco: o pico de memória não cresce com a planilha.
+    """
+    partes = []
+    for inicio in range(0, len(registros) if cols_itens else 0, BLOCO_LINHAS):
+        bloco = bruto[inicio:inicio + BLOCO_LINHAS, indices_itens]
+        niveis = np.nan_to_num(_numeros(bloco), copy=False).reshape(bloco.shape)
+        lin, col = np.nonzero(niveis > 0)
+        partes.append(pd.DataFrame({'Registro': registros[inicio + lin], 'item': np.asarray(cols_itens, dtype=object)[col], 'nivel': niveis[lin, col]}))
+    if coluna_consumo is not None:
+        texto = pd.Series(coluna_consumo, index=registros, dtype=object)
+        pares = texto[texto != ''].str.split(';').explode().str.strip()
+        pares = pares[pares != '']
+        # "ITEM=N" se repete muito: separa cada par distinto uma vez
+        codigos, distintos = pd.factorize(pares.to_numpy(dtype=object))
+        partido = pd.Series(distintos, dtype=object).str.rpartition('=')
+        pares = pd.DataFrame({'Registro': pares.index.to_numpy(), 'item': partido[0].str.strip().to_numpy(dtype=object)[codigos],
+                              'nivel': _numeros(partido[2])[codigos]})
+        partes.append(pares[pares['nivel'] > 0])
+    if not partes: return consumo_vazio()
+
+    consumo = pd.concat(partes, ignore_index=True)
+    # Linhas migradas podem ter o mesmo item nas duas formas: fica o maior nível
+    consumo = consumo.groupby(['Registro', 'item'], as_index=False, sort=False)['nivel'].max()
+    return consumo.astype({'Registro': 'int32', 'item': 'category', 'nivel': 'int8'})
+
+def _converter(valores, tipo):
+    """Coluna de strings -> tipo do ESQUEMA_DADOS (número inválido vira NaN; Bristol vazio vira 0)."""
+    if tipo == 'category': return pd.Categorical(valores)
+    numeros = _numeros(valores)
+    if tipo == 'int8': return np.nan_to_num(numeros).astype('int8')
+    return numeros.astype(tipo)
+
+def tipar_categorias(df):
+    """Reaplica as categorias do esquema (concatenar lotes com categorias diferentes volta a texto)."""
+    return df.astype({c: 'category' for c, tipo in ESQUEMA_DADOS.items() if tipo == 'category' and c in df.columns})
+
+def tipar_linhas(headers, linhas, cols_numericas, inicio=0):
+    """Converte linhas brutas (strings) da aba de Dados em (registros tipados, consumo em formato longo).
+
+    Uma passada guiada por ESQUEMA_DADOS: a matriz de strings é montada uma vez e cada coluna
+    vai direto para o tipo final; datas usam FORMATO_DATA_HORA explícito.
+    `Registro` é a posição da linha na aba (a partir de `inicio`) e liga os dois DataFrames.
+    Os itens saem do DataFrame de registros: memória e cópia crescem com o que foi consumido.
+    """
+    largura = len(headers)
+    if not linhas or not largura: return pd.DataFrame(), consumo_vazio()
+    if any(len(l) != largura for l in linhas):  # batch_get corta as células vazias do fim da linha
+        linhas = [(list(l) + [''] * largura)[:largura] for l in linhas]
+    bruto = np.array(linhas, dtype=object).reshape(len(linhas), largura)
+    posicao = {h: i for i, h in enumerate(headers)}
+    registros = np.arange(inicio, inicio + len(bruto), dtype=np.int32)
+
+    # --- TRATAMENTO NUMÉRICO ROBUSTO (Correção V25) ---
+    # Colunas largas antigas (Alimentos Puros, Rastreadores e Receitas) + coluna Consumo viram formato longo
+    cols_itens = [c for c in posicao if c in cols_numericas]
+    consumo = _extrair_consumo(registros, bruto, [posicao[c] for c in cols_itens], cols_itens,
+                               bruto[:, posicao[COLUNA_CONSUMO]] if COLUNA_CONSUMO in posicao else None)
+
+    colunas = {}
+    for h, i in posicao.items():
+        if h in cols_itens or h in (COLUNA_CONSUMO, COLUNA_ENVIO): continue
+        colunas[h] = _converter(bruto[:, i], ESQUEMA_DADOS[h]) if h in ESQUEMA_DADOS else bruto[:, i]
+    # Compatibilidade legado
+    for legado in COLUNAS_LEGADO:
+        if legado in colunas and 'Circunferencia_Cintura' not in colunas:
+            colunas['Circunferencia_Cintura'] = _converter(colunas[legado], 'float32')
+    colunas['Registro'] = registros
+
+    # Datas: formato fixo (rápido); só o que não casar passa pela leitura flexível
+    data_hora = pd.Series(colunas['Data'], dtype=object) + ' ' + pd.Series(colunas['Hora'], dtype=object)
+    colunas['DataHora'] = pd.to_datetime(data_hora, format=FORMATO_DATA_HORA, errors='coerce')
+    falhou = colunas['DataHora'].isna() & (data_hora.str.strip() != '')
+    if falhou.any():
+        colunas['DataHora'][falhou] = pd.to_datetime(data_hora[falhou], dayfirst=True, format='mixed', errors='coerce')
+
+    df = pd.DataFrame(colunas)
+    df = df[df['DataHora'].notna()]
+    return df, consumo[consumo['Registro'].isin(df['Registro'])]
+
+def concatenar(antigo, novo):
+    if novo.empty: return antigo
+    if antigo.empty: return novo
+    return pd.concat([antigo, novo], ignore_index=True)
+
+def finalizar_dados(df, consumo, receitas):
+    """Ordena do mais recente para o mais antigo, calcula o Porto Seguro e expande as receitas."""
+    if df.empty: return pd.DataFrame(), consumo_vazio()
+    df = df.sort_values(by='DataHora', ascending=False).reset_index(drop=True)
+    
+    # --- LÓGICA DE PORTO SEGURO (Com Janela de Arraste de 3 Dias) ---
+    with etapa("Porto Seguro"): df['Porto_Seguro'] = calcular_porto_seguro(df['DataHora'], df['Escala de Bristol'] >= 5)
+    with etapa("Expandir receitas"): return df, expandir_receitas_consumo(consumo, receitas)
+
+def expandir_receitas_consumo(consumo, receitas):
+    """Acrescenta ao consumo os ingredientes (achatados) das receitas registradas.
+
+    Registros antigos que só guardaram o nome do prato passam a expor os ingredientes na
+    análise; os que já têm os ingredientes não mudam (fica o maior nível).
+    """
+    regras = [(nome, item, segue) for nome, itens in receitas.expansao.items() for item, segue in itens.items() if item != nome]
+    if consumo.empty or not regras: return consumo
+    com_receita = consumo['Registro'].isin(consumo.loc[consumo['item'].isin(list(receitas.expansao)), 'Registro'])
+    if not com_receita.any(): return consumo
+
+    afetados = consumo[com_receita].astype({'item': str})
+    regras = pd.DataFrame(regras, columns=['item', 'ingrediente', 'segue'])
+    exp = afetados.merge(regras, on='item')
+    exp = pd.DataFrame({'Registro': exp['Registro'], 'item': exp['ingrediente'], 'nivel': exp['nivel'].where(exp['segue'], 1)})
+    afetados = pd.concat([afetados, exp], ignore_index=True).groupby(['Registro', 'item'], as_index=False, sort=False)['nivel'].max()
+    consumo = pd.concat([consumo[~com_receita].astype({'item': str}), afetados], ignore_index=True)
+    return consumo.astype({'Registro': 'int32', 'item': 'category', 'nivel': 'int8'})
+
+# --- PORTO SEGURO E EXPOSIÇÃO ---
+
+def calcular_porto_seguro(datas, crises, dias_janela=3, registros_minimos=3):
+    """Marca registros sem crise nos `dias_janela` dias anteriores (janela de arraste).
+
+    Ordena uma única vez e usa busca binária + soma acumulada de crises: O(n log n).
+    Os primeiros `registros_minimos` registros cronológicos nunca são Porto Seguro.
+    Retorna uma Series booleana alinhada ao índice de `datas`.
+    """
+    datas = pd.Series(datas)
+    crises = pd.Series(crises, index=datas.index).fillna(False).astype(bool)
+    ordem = np.argsort(datas.to_numpy(dtype='datetime64[ns]'), kind='stable')
+    t = datas.to_numpy(dtype='datetime64[ns]')[ordem]
+    c = crises.to_numpy()[ordem]
+
+    # Janela de cada registro: [t - dias_janela, t) -> índices [inicio, fim)
+    inicio = np.searchsorted(t, t - np.timedelta64(dias_janela, 'D'), side='left')
+    fim = np.searchsorted(t, t, side='left')
+    acumulado = np.concatenate(([0], np.cumsum(c)))
+    crises_na_janela = acumulado[fim] - acumulado[inicio]
+
+    porto = (fim > inicio) & (crises_na_janela == 0)
+    porto[:registros_minimos] = False
+
+    resultado = np.zeros(len(t), dtype=bool)
+    resultado[ordem] = porto
+    return pd.Series(resultado, index=datas.index, name='Porto_Seguro')
+
+def consumo_com_registro(consumo, df, *colunas):
+    """Consumo (formato longo) restrito aos registros de `df`, com as `colunas` do registro anexadas."""
+    info = df.set_index('Registro')
+    sel = consumo[consumo['Registro'].isin(info.index)]
+    return sel.assign(**{c: info[c].reindex(sel['Registro']).to_numpy() for c in colunas})
+
+def exposicao_diaria(df_analise, consumo, itens):
+    """(item, Dia, nivel): maior nível de cada item em cada dia de `df_analise`."""
+    sel = consumo_com_registro(consumo[consumo['item'].isin(itens)], df_analise, 'DataHora')
+    exposicao = pd.DataFrame({'item': sel['item'].astype(str), 'Dia': sel['DataHora'].dt.normalize(), 'nivel': sel['nivel']})
+    return exposicao.groupby(['item', 'Dia'], as_index=False)['nivel'].max()
+
+# --- AGREGADOS DO HISTÓRICO ---
+
+def multi_hot(valores):
+    """Textos "A, B" -> DataFrame booleano (registro x marca), tokenizando cada texto distinto uma vez.
+
+    Cada marca aparece com a grafia do ranking antigo (`str.capitalize`: "Dor abdominal"), então
+    grafias que só diferem em maiúsculas viram uma coluna.
+    """
+    textos = pd.Series(np.asarray(valores, dtype=object), index=valores.index).fillna('')
+    codigos, distintos = pd.factorize(textos.to_numpy(dtype=object))
+    tokens = [[t.strip().capitalize() for t in SEPARADOR_MARCAS.split(str(texto)) if t.strip()] for texto in distintos]
+    colunas = {marca: j for j, marca in enumerate(sorted({t for tk in tokens for t in tk}))}
+    matriz = np.zeros((len(distintos), len(colunas)), dtype=bool)
+    for i, tk in enumerate(tokens): matriz[i, [colunas[t] for t in tk]] = True
+    return pd.DataFrame(matriz[codigos], index=valores.index, columns=list(colunas))
+
+def marcas_por_dia(marcas, dia):
+    """Lista (ordenada) das marcas presentes em cada dia."""
+    por_dia = marcas.groupby(dia.to_numpy(), sort=False).any()
+    linhas, cols = np.nonzero(por_dia.to_numpy())
+    return pd.Series(por_dia.columns[cols], index=por_dia.index[linhas]).groupby(level=0, sort=False).agg(list)
+
+def montar_cubo_diario(df, consumo, marcas, itens_menu, itens_grafico):
+    """Agregado por dia usado pelo Histórico, em uma passada de groupby por campo.
+
+    Retorna {'dias': DataFrame indexado pelo dia (mais recente primeiro) com bristols,
+    menu, sintomas, remédios e notas; 'dias_por_item': dias distintos de consumo de cada item de `itens_grafico`}.
+    """
+    dia = df['DataHora'].dt.normalize()
+    dias = pd.DataFrame(index=pd.Index(dia.unique(), name='dia')).sort_index(ascending=False)
+
+    # Bristol na ordem do df (mais recente primeiro), como nos cards
+    com_bristol = df['Escala de Bristol'] > 0
+    dias['bristols'] = df.loc[com_bristol, 'Escala de Bristol'].astype(int).groupby(dia[com_bristol], sort=False).agg(list)
+
+    itens_dia = consumo_com_registro(consumo, df, 'DataHora')
+    itens_dia = pd.DataFrame({'dia': itens_dia['DataHora'].dt.normalize(), 'item': itens_dia['item'].astype(str)}).drop_duplicates()
+    menu = itens_dia[itens_dia['item'].isin(itens_menu)].sort_values('item')
+    dias['menu'] = menu.groupby('dia', sort=False)['item'].agg(list)
+
+    dias['sintomas'] = marcas_por_dia(marcas['sintomas'], dia)
+    dias['remedios'] = marcas_por_dia(marcas['remedios'], dia)
+
+    notas = df['Notas'][df['Notas'].fillna('') != '']
+    dias['notas'] = notas.groupby(dia.loc[notas.index].to_numpy(), sort=False).agg(list)
+
+    for col in ['bristols', 'menu', 'sintomas', 'remedios', 'notas']:
+        dias[col] = [v if isinstance(v, list) else [] for v in dias[col]]
+
+    grafico = itens_dia[itens_dia['item'].isin(itens_grafico)]
+    return {'dias': dias, 'dias_por_item': grafico['item'].value_counts()}
+
+def contar_sintomas(df, sintomas):
+    """Ranking de sintomas (Qtd e % dos registros) a partir do multi-hot de `indice_marcas`.
+
+    Qtd é o número de registros com o sintoma (repetido no mesmo registro conta uma vez).
+    """
+    qtd = sintomas.sum().sort_values(ascending=False, kind='stable')
+    sint_counts = qtd[qtd > 0].rename_axis('Sintoma').reset_index(name='Qtd')
+    sint_counts['%'] = (sint_counts['Qtd'] / len(df)) * 100
+    return sint_counts
+
+def serie_medidas(df, agrupamento="Automático", dias_diarios=180):
+    """Medidas reamostradas (média por dia ou semana) para o gráfico; zeros são falta de medida.
+
+    No automático, históricos mais longos que `dias_diarios` viram médias semanais.
+    """
+    cols_plot = [c for c in ['Circunferencia_Cintura', 'Circunferencia_Abdominal'] if c in df.columns]
+    if not cols_plot: return pd.DataFrame()
+    medidas = df.set_index('DataHora')[cols_plot].replace(0, np.nan).dropna(how='all').sort_index()
+    if medidas.empty: return medidas
+    if agrupamento == "Automático":
+        agrupamento = "Semana" if medidas.index[-1] - medidas.index[0] > pd.Timedelta(days=dias_diarios) else "Dia"
+    return medidas.resample('W' if agrupamento == "Semana" else 'D').mean().dropna(how='all').astype('float32')
@@ -0,0 +1,51 @@
+"""Índice de receitas: expansão pré-calculada (com sub-receitas) de prato -> ingredientes.
+
+Uma receita tem ingredientes Base ('main', acompanham o nível consumido), Traços ('minor',
+sempre nível 1) e Rastreadores ('trackers', acompanham o nível). Um ingrediente pode ser
+outra receita: a expansão é achatada uma vez, ao carregar, e usar uma receita vira uma
+consulta de dicionário.
+"""
+
+
+class IndiceReceitas(dict):
+    """{NOME: {'main': [...], 'minor': [...], 'trackers': [...]}} + expansão resolvida.
+
+    `expansao[NOME]` é {item: segue_nivel}, incluindo a própria receita e as sub-receitas.
+    `ciclos` lista as referências circulares encontradas (ex: ['A', 'B', 'A']); a
+    referência que fecha o ciclo é tratada como item simples.
+    """
+
+    def __init__(self, receitas=None):
+        super().__init__(receitas or {})
+        self.expansao = {}
+        self.ciclos = []
+        for nome in self: self._resolver(nome, [])
+
+    def _resolver(self, nome, caminho):
+        if nome in self.expansao: return self.expansao[nome]
+        if nome in caminho:
+            self.ciclos.append(caminho[caminho.index(nome):] + [nome])
+            return None
+
+        caminho.append(nome)
+        regras = {nome: True}
+        for chave, segue in (('main', True), ('trackers', True), ('minor', False)):
+            for ingrediente in self[nome].get(chave, []):
+                sub = self._resolver(ingrediente, caminho) if ingrediente in self else None
+                for item, segue_sub in (sub or {ingrediente: True}).items():
+                    # Traço de traço continua traço; basta um caminho pela Base para seguir o nível
+                    regras[item] = regras.get(item, False) or (segue and segue_sub)
+        caminho.pop()
+        self.expansao[nome] = regras
+        return regras
+
+    def expandir(self, item, nivel):
+        """{ingrediente: nível} consumido ao registrar `item` no `nivel` (item puro volta sozinho)."""
+        regras = self.expansao.get(item)
+        if regras is None: return {item: nivel}
+        return {ingrediente: nivel if segue else 1 for ingrediente, segue in regras.items()}
+
+    def ciclos_com(self, nome, main, minor, trackers):
+        """Ciclos que surgiriam ao salvar a receita `nome` com esses ingredientes."""
+        novo = IndiceReceitas({**self, nome: {'main': list(main), 'minor': list(minor), 'trackers': list(trackers)}})
+        return [c for c in novo.ciclos if nome in c]
@@ -0,0 +1,253 @@
+"""Diário sintético e planilha em memória com a API do gspread usada pelo ArmazenamentoSheets.
+
+Permite rodar o app e medir os caminhos quentes sem rede nem planilha real
+(DIARIO_BACKEND=simulado): a latência de cada chamada é simulada e as chamadas entram no
+ContadorAPI, como as do gspread de verdade.
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+
+import gspread
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+from armazenamento import CABECALHO_DADOS, CABECALHO_CONFIG, CABECALHO_RECEITAS, formatar_consumo, titulo_aba
+
+SINTOMAS_SIMULADOS = ['Estufamento', 'Gases', 'Cólica', 'Dor Abdominal']
+REMEDIOS_SIMULADOS = ['Buscopan', 'Simeticona', 'Probiótico']
+RASTREADORES_SIMULADOS = ['GLÚTEN', 'LACTOSE', 'FRITURA', 'AÇÚCAR', 'CAFEÍNA']
+
+
+def gerar_diario(dias=365, registros_por_dia=4, alimentos=60, receitas=5, gatilhos=None, risco_basal=0.05,
+                 inicio=datetime(2024, 1, 1), semente=0, defasagem=0):
+    """Histórico sintético no formato da planilha: {'Dados': [...], 'Config': [...], 'Receitas': [...]}.
+
+    `alimentos` é o tamanho do vocabulário (ou a lista de nomes). `gatilhos` ({alimento: risco})
+    injeta crises: cada registro com o alimento provoca, com essa probabilidade, uma evacuação
+    Bristol 6-7 com cólica `defasagem` dias depois. Com 0, ela é um registro extra duas horas
+    depois da refeição (janela 0/1 do Detetive); com N, o primeiro registro do dia +N (janela N+1).
+    Fora isso, crises aparecem com `risco_basal`.
+    """
+    rnd = random.Random(semente)
+    vocabulario = list(alimentos) if not isinstance(alimentos, int) else [f"ALIMENTO {i:03d}" for i in range(alimentos)]
+    gatilhos = dict(gatilhos) if gatilhos is not None else {vocabulario[0]: 0.6}
+    pratos = {}
+    for i in range(receitas):
+        pratos[f"RECEITA {i + 1:02d}"] = {'main': rnd.sample(vocabulario, 3), 'minor': rnd.sample(vocabulario, 1),
+                                          'trackers': rnd.sample(RASTREADORES_SIMULADOS, 1)}
+
+    def registro(hora, consumo, crise, cintura=''):
+        bristol = rnd.choice([6, 7]) if crise else rnd.choice(['', '', 2, 3, 3, 4, 4])
+        if crise: sintomas = ['Cólica'] + rnd.sample(SINTOMAS_SIMULADOS, rnd.randint(0, 1))
+        else: sintomas = rnd.sample(SINTOMAS_SIMULADOS, 1) if rnd.random() < 0.1 else []
+        valores = {'Data': hora.strftime("%d/%m/%Y"), 'Hora': hora.strftime("%H:%M"), 'Escala de Bristol': bristol,
+                   'Diarreia': 'S' if bristol != '' and bristol >= 5 else '', 'Características': ", ".join(dict.fromkeys(sintomas)),
+                   'Remédios': rnd.choice(REMEDIOS_SIMULADOS) if crise and rnd.random() < 0.5 else '',
+                   'Circunferencia_Cintura': cintura, 'Circunferencia_Abdominal': '', 'Notas': '', 'Humor': '',
+                   'Consumo': formatar_consumo(consumo)}
+        return [str(valores[h]) for h in CABECALHO_DADOS]
+
+    dados, crises_marcadas = [list(CABECALHO_DADOS)], set()  # Dias com crise provocada no primeiro registro
+    for d in range(dias):
+        dia = inicio + timedelta(days=d)
+        crise_hoje = d in crises_marcadas or rnd.random() < risco_basal
+        for r in range(registros_por_dia):
+            hora = dia + timedelta(hours=7 + r * 14 / max(registros_por_dia, 1), minutes=rnd.randint(0, 59))
+            consumo = {item: rnd.choice([1, 1, 2, 3]) for item in rnd.sample(vocabulario + list(pratos), rnd.randint(1, 4))}
+            provocou = any(rnd.random() < gatilhos.get(item, 0) for item in consumo)
+            dados.append(registro(hora, consumo, crise_hoje and r == 0, round(rnd.uniform(70, 90), 1) if r == 0 and d % 7 == 0 else ''))
+            if provocou and defasagem == 0: dados.append(registro(hora + timedelta(hours=2), {}, True))
+            elif provocou: crises_marcadas.add(d + defasagem)
+
+    config = [list(CABECALHO_CONFIG)] + [[a, s] for a, s in zip(vocabulario, SINTOMAS_SIMULADOS)] + [[a, ''] for a in vocabulario[len(SINTOMAS_SIMULADOS):]]
+    tab_receitas = [list(CABECALHO_RECEITAS)] + [[nome, ",".join(p['main']), ",".join(p['minor']), ",".join(p['trackers'])]
+                                                 for nome, p in pratos.items()]
+    return {'Dados': dados, 'Config': config, 'Receitas': tab_receitas}
+
+
+class AbaSimulada:
+    """Worksheet em memória (células como strings, como o Sheets devolve)."""
+
+    def __init__(self, planilha, titulo, linhas=1000, colunas=26, valores=None, id=0):
+        self._planilha = planilha
+        self.title = titulo
+        self.id = id
+        self.row_count = linhas
+        self.col_count = colunas
+        self._valores = [[str(v) for v in linha] for linha in (valores or [])]
+
+    def _chamar(self, metodo, operacao, valores=None):
+        self._planilha._chamar(metodo, f"values/{self.title}{operacao}", valores)
+
+    def _grade(self, intervalo):
+        g = a1_range_to_grid_range(intervalo)
+        return g.get('startRowIndex', 0), g.get('endRowIndex'), g.get('startColumnIndex', 0), g.get('endColumnIndex')
+
+    def _ler(self, intervalo=None):
+        l0, l1, c0, c1 = self._grade(intervalo) if intervalo else (0, None, 0, None)
+        linhas = [linha[c0:c1] for linha in self._valores[l0:l1]]
+        # Como a API: sem células vazias no fim das linhas nem linhas vazias no fim
+        linhas = [linha[:max((i + 1 for i, v in enumerate(linha) if v != ''), default=0)] for linha in linhas]
+        while linhas and not linhas[-1]: linhas.pop()
+        return linhas
+
+    def _escrever(self, linha, coluna, valores):
+        for i, valores_linha in enumerate(valores):
+            while len(self._valores) <= linha + i: self._valores.append([])
+            atual = self._valores[linha + i]
+            for j, v in enumerate(valores_linha):
+                while len(atual) <= coluna + j: atual.append('')
+                atual[coluna + j] = str(v)
+
+    def get_all_values(self, **_):
+        self._chamar('GET', '')
+        largura = max((len(linha) for linha in self._valores), default=0)
+        return [linha + [''] * (largura - len(linha)) for linha in self._valores]
+
+    def get_all_records(self, **_):
+        valores = self.get_all_values()
+        return [dict(zip(valores[0], linha)) for linha in valores[1:]] if valores else []
+
+    def row_values(self, linha, **_):
+        self._chamar('GET', '')
+        valores = self._ler(f"{linha}:{linha}")
+        return valores[0] if valores else []
+
+    def col_values(self, coluna, **_):
+        self._chamar('GET', '')
+        return [linha[coluna - 1] if len(linha) >= coluna else '' for linha in self._valores]
+
+    def batch_get(self, intervalos, **_):
+        self._planilha._chamar('GET', 'values:batchGet')
+        return [self._ler(intervalo) for intervalo in intervalos]
+
+    def update(self, intervalo, valores=None, **_):
+        self._chamar('PUT', '', valores)
+        l0, _, c0, _ = self._grade(intervalo)
+        self._escrever(l0, c0, valores)
+
+    def update_cell(self, linha, coluna, valor):
+        self.update(rowcol_to_a1(linha, coluna), [[valor]])
+
+    def append_rows(self, linhas, table_range=None, **_):
+        self._chamar('POST', ':append', linhas)
+        # Como a API: a "tabela" é procurada só nas colunas de `table_range`
+        _, _, c0, c1 = self._grade(table_range) if table_range else (0, None, 0, None)
+        ocupadas = [i for i, linha in enumerate(self._valores) if any(v != '' for v in linha[c0:c1])]
+        self._escrever(ocupadas[-1] + 1 if ocupadas else 0, c0, linhas)
+        self.row_count = max(self.row_count, len(self._valores))
+
+    def append_row(self, linha, **kwargs):
+        self.append_rows([linha], **kwargs)
+
+    def add_cols(self, n):
+        self._planilha._chamar('POST', ':batchUpdate')
+        self.col_count += n
+
+    def add_rows(self, n):
+        self._planilha._chamar('POST', ':batchUpdate')
+        self.row_count += n
+
+    def update_title(self, titulo):
+        self._planilha._chamar('POST', ':batchUpdate')
+        self.title = titulo
+
+    def clear(self):
+        self._chamar('POST', ':clear')
+        self._valores = []
+
+    def resize(self, rows=None, cols=None):
+        self._planilha._chamar('POST', ':batchUpdate')
+        self.row_count, self.col_count = rows or self.row_count, cols or self.col_count
+
+
+class PlanilhaSimulada:
+    """Spreadsheet em memória; cada chamada espera `latencia` segundos e vai para o `contador`."""
+
+    def __init__(self, abas=None, latencia=0.0, contador=None, titulo="Diario_Simulado"):
+        self.id = "simulada"
+        self.title = titulo
+        self.latencia = latencia
+        self.contador = contador
+        self.chamadas = 0
+        self.compartilhada_com = []
+        self._abas = [AbaSimulada(self, nome, max(len(valores), 1000), max((len(l) for l in valores), default=26), valores, id=i)
+                      for i, (nome, valores) in enumerate((abas or {'Dados': [list(CABECALHO_DADOS)]}).items())]
+
+    def _chamar(self, metodo, caminho, valores=None):
+        inicio = time.perf_counter()
+        if self.latencia: time.sleep(self.latencia)
+        self.chamadas += 1
+        if self.contador is not None:
+            self.contador.registrar(metodo, f"https://sheets.googleapis.com/v4/spreadsheets/{self.id}/{caminho}",
+                                    len(repr(valores)) if valores is not None else 0, 0, time.perf_counter() - inicio, 200)
+
+    @property
+    def sheet1(self):
+        self._chamar('GET', '')
+        return self._abas[0]
+
+    def worksheets(self):
+        self._chamar('GET', '')
+        return list(self._abas)
+
+    def worksheet(self, titulo):
+        self._chamar('GET', '')
+        for aba in self._abas:
+            if aba.title == titulo: return aba
+        raise gspread.WorksheetNotFound(titulo)
+
+    def values_batch_get(self, intervalos, **_):
+        """Só abas inteiras ("'Título'"), como o ArmazenamentoSheets usa."""
+        self._chamar('GET', 'values:batchGet')
+        abas = {aba.title: aba for aba in self._abas}
+        return {'valueRanges': [{'range': intervalo, 'values': abas[intervalo.strip("'")]._ler()} for intervalo in intervalos]}
+
+    def add_worksheet(self, title, rows=100, cols=26, **_):
+        self._chamar('POST', ':batchUpdate')
+        aba = AbaSimulada(self, title, rows, cols, id=len(self._abas))
+        self._abas.append(aba)
+        return aba
+
+    def share(self, email_address, perm_type='user', role='writer', **_):
+        self._chamar('POST', 'permissions')
+        self.compartilhada_com.append((email_address, role))
+
+    def duplicate_sheet(self, source_sheet_id, new_sheet_name=None, **_):
+        self._chamar('POST', ':batchUpdate')
+        origem = next(aba for aba in self._abas if aba.id == source_sheet_id)
+        copia = AbaSimulada(self, new_sheet_name or f"Cópia de {origem.title}", origem.row_count, origem.col_count,
+                            origem._valores, id=len(self._abas))
+        self._abas.append(copia)
+        return copia
+
+
+class ClienteSimulado:
+    """`gspread.Client` com as planilhas em memória: `open` por título e `create` (planilha com uma aba vazia)."""
+
+    def __init__(self, planilhas=None, latencia=0.0, contador=None):
+        self.planilhas = dict(planilhas or {})
+        self.latencia, self.contador = latencia, contador
+
+    def open(self, titulo):
+        if titulo not in self.planilhas: raise gspread.SpreadsheetNotFound(titulo)
+        return self.planilhas[titulo]
+
+    def create(self, titulo, folder_id=None):
+        planilha = PlanilhaSimulada({'Sheet1': []}, self.latencia, self.contador, titulo)
+        planilha.id, planilha.pasta = f"simulada-{len(self.planilhas)}", folder_id
+        self.planilhas[titulo] = planilha
+        return planilha
+
+
+def planilha_simulada(latencia=0.0, contador=None, usuarios=(), **diario):
+    """PlanilhaSimulada preenchida por `gerar_diario(**diario)`.
+
+    Cada um dos `usuarios` ganha o próprio diário (abas Dados_<usuario> etc., outra semente).
+    """
+    abas = gerar_diario(**diario)
+    for i, usuario in enumerate(usuarios, 1):
+        proprio = gerar_diario(**{**diario, 'semente': diario.get('semente', 0) + i})
+        abas.update({titulo_aba(nome, usuario): valores for nome, valores in proprio.items()})
+    return PlanilhaSimulada(abas, latencia=latencia, contador=contador)
@@ -0,0 +1,41 @@
+"""Fixtures dos testes e benchmarks: diário sintético e planilha em memória (simulacao.py).
+
+`carregar` faz o mesmo caminho de leitura do app (Config, Receitas, Dados -> tipagem ->
+Porto Seguro e receitas expandidas), sem Streamlit e sem cache.
+"""
+
+import pytest
+
+from armazenamento import ArmazenamentoSheets
+from processamento import tipar_linhas, finalizar_dados, multi_hot
+from receitas import IndiceReceitas
+from simulacao import PlanilhaSimulada, RASTREADORES_SIMULADOS, gerar_diario
+
+
+def carregar(armazenamento):
+    """(df, consumo, itens de análise, receitas) como o app monta na carga."""
+    lista_alim, _ = armazenamento.ler_listas_config([], [])
+    receitas = IndiceReceitas(armazenamento.ler_receitas())
+    cols_numericas = set(lista_alim + RASTREADORES_SIMULADOS + list(receitas.keys()))
+    headers, linhas = armazenamento.ler_tudo()
+    df, consumo = finalizar_dados(*tipar_linhas(headers, linhas, cols_numericas), receitas)
+    return df, consumo, sorted(set(lista_alim + RASTREADORES_SIMULADOS)), receitas
+
+def armazenamento_simulado(diario, **kwargs):
+    planilha = PlanilhaSimulada(diario, **kwargs)
+    return ArmazenamentoSheets(lambda: planilha)
+
+
+@pytest.fixture(scope="session")
+def diario():
+    """Um ano, 4 registros por dia, ALIMENTO 000 como gatilho (60% de crise na janela 1)."""
+    return gerar_diario(dias=365)
+
+@pytest.fixture(scope="session")
+def dados(diario):
+    return carregar(armazenamento_simulado(diario))
+
+@pytest.fixture(scope="session")
+def marcas(dados):
+    df = dados[0]
+    return {'sintomas': multi_hot(df['Características']), 'remedios': multi_hot(df['Remédios'])}
@@ -0,0 +1,41 @@
+"""Arquivo por ano: `arquivar_anos` move registros sem perder nem duplicar, e `importar_de` leva o arquivo junto."""
+
+from datetime import datetime
+
+from armazenamento import ArmazenamentoSQLite, separar_registro
+from conftest import armazenamento_simulado
+from simulacao import gerar_diario
+
+
+def _registros(headers, linhas):
+    return sorted((fixos['Data'], fixos['Hora'], tuple(sorted(consumo.items())))
+                  for fixos, consumo in (separar_registro(headers, linha) for linha in linhas if any(linha)))
+
+def test_arquivar_anos():
+    armazenamento = armazenamento_simulado(gerar_diario(dias=500, inicio=datetime(2023, 1, 1)))
+    headers, linhas = armazenamento.ler_tudo()
+    antes = _registros(headers, linhas)
+
+    movidos = armazenamento.arquivar_anos(2024)
+    assert list(movidos) == [2023] and sum(movidos.values()) == sum(1 for r in antes if r[0].endswith('2023'))
+    # A última linha lida ficou em branco: a leitura incremental pede recarga completa
+    assert armazenamento.ler_novas_linhas(headers, len(linhas)) == (None, [])
+
+    headers_dados, dados = armazenamento.ler_tudo()
+    arquivo = armazenamento.workbook.worksheet("Arquivo_2023").get_all_values()
+    assert not any(l[0].endswith('2023') for l in dados if any(l))
+    assert sorted(_registros(headers_dados, dados) + _registros(arquivo[0], arquivo[1:])) == antes
+
+    # Registro novo entra logo depois dos que ficaram, não depois das linhas em branco
+    armazenamento.adicionar_registro({'Data': "01/06/2025", 'Hora': "12:00"}, {'ALIMENTO 001': 1})
+    _, depois = armazenamento.ler_tudo()
+    assert depois[sum(1 for l in dados if any(l))][0] == "01/06/2025"
+
+def test_importar_para_sqlite_inclui_arquivo(tmp_path):
+    origem = armazenamento_simulado(gerar_diario(dias=500, inicio=datetime(2023, 1, 1)))
+    headers, linhas = origem.ler_tudo()
+    origem.arquivar_anos(2024)
+
+    destino = ArmazenamentoSQLite(str(tmp_path / "diario.db"))
+    assert destino.importar_de(origem) == sum(1 for l in linhas if any(l))
+    assert _registros(*destino.ler_tudo()) == _registros(headers, linhas)
@@ -0,0 +1,79 @@
+"""Benchmarks dos caminhos quentes do app: carga, Porto Seguro, Histórico, Detetive e gravação."""
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from conftest import armazenamento_simulado, carregar
+from detetive import perfil_gatilhos, combinacoes_gatilho
+from processamento import calcular_porto_seguro, exposicao_diaria, finalizar_dados, montar_cubo_diario, tipar_linhas
+
+LAG_MAXIMO = 7
+LATENCIA_SHEETS = 0.3  # Segundos por chamada, ordem de grandeza da API do Sheets
+
+
+def _entrada_detetive(df, consumo, itens):
+    df_analise = df[df['Porto_Seguro']]
+    return (df_analise['DataHora'].dt.normalize(), exposicao_diaria(df_analise, consumo, itens),
+            df.loc[df['Escala de Bristol'] >= 5, 'DataHora'])
+
+def test_carga(benchmark, diario):
+    df, consumo, itens, _ = benchmark(lambda: carregar(armazenamento_simulado(diario)))
+    assert len(df) == len(diario['Dados']) - 1
+    assert df['DataHora'].is_monotonic_decreasing
+    assert not consumo.empty and 'ALIMENTO 000' in itens
+
+@pytest.mark.benchmark(group="partida")
+def test_partida_fria(benchmark, diario):
+    """Sem snapshot: Config, Receitas e Dados vêm da planilha (com latência de rede)."""
+    df = benchmark.pedantic(lambda: carregar(armazenamento_simulado(diario, latencia=LATENCIA_SHEETS))[0], rounds=3)
+    assert len(df) == len(diario['Dados']) - 1
+
+@pytest.mark.benchmark(group="partida")
+def test_partida_quente(benchmark, diario, tmp_path):
+    """Com snapshot: Parquet local + finalização, como `carregar_snapshot` no app."""
+    armazenamento = armazenamento_simulado(diario)
+    fria, _, itens, receitas = carregar(armazenamento)
+    df, consumo = tipar_linhas(*armazenamento.ler_tudo(), set(itens) | set(receitas.keys()))
+    df.to_parquet(tmp_path / "dados.parquet", index=False)
+    consumo.to_parquet(tmp_path / "consumo.parquet", index=False)
+    def partida():
+        return finalizar_dados(pd.read_parquet(tmp_path / "dados.parquet"), pd.read_parquet(tmp_path / "consumo.parquet"), receitas)[0]
+    quente = benchmark(partida)
+    assert quente['Porto_Seguro'].equals(fria['Porto_Seguro'])
+
+def test_porto_seguro(benchmark, dados):
+    df = dados[0]
+    porto = benchmark(calcular_porto_seguro, df['DataHora'], df['Escala de Bristol'] >= 5)
+    assert porto.equals(df['Porto_Seguro'])
+
+def test_cubo_historico(benchmark, dados, marcas):
+    df, consumo, itens, receitas = dados
+    itens_menu = frozenset(itens) | frozenset(receitas.keys())
+    cubo = benchmark(montar_cubo_diario, df, consumo, marcas, itens_menu, frozenset(itens))
+    assert len(cubo['dias']) == df['DataHora'].dt.normalize().nunique()
+    assert cubo['dias_por_item']['ALIMENTO 000'] > 0
+
+def test_detetive_perfil(benchmark, dados):
+    df, consumo, itens, _ = dados
+    entrada = _entrada_detetive(df, consumo, itens)
+    resultado = benchmark(perfil_gatilhos, *entrada, LAG_MAXIMO, 1, 4, 'fdr', 0)
+    perfil = resultado['perfil']
+    # O gatilho injetado é o maior suspeito na janela padrão do app (1 dia)
+    janela_1 = perfil[perfil['lag'] == 1].sort_values('rr', ascending=False)
+    assert janela_1['item'].iloc[0] == 'ALIMENTO 000'
+    assert janela_1['p_ajustado'].iloc[0] < 0.05
+
+def test_detetive_combinacoes(benchmark, dados):
+    df, consumo, itens, _ = dados
+    combinacoes = benchmark(combinacoes_gatilho, *_entrada_detetive(df, consumo, itens), 1, 1, 4, 2, 'fdr')
+    assert not combinacoes.empty
+
+def test_salvar(benchmark, diario):
+    armazenamento = armazenamento_simulado(diario)
+    _, antes = armazenamento.ler_tudo()
+    valores = {'Data': datetime(2025, 1, 1).strftime("%d/%m/%Y"), 'Hora': "12:00", 'Escala de Bristol': 4}
+    benchmark(armazenamento.adicionar_registro, valores, {'ALIMENTO 001': 2})
+    _, depois = armazenamento.ler_tudo()
+    assert len(depois) > len(antes) and depois[-1][0] == "01/01/2025"
@@ -0,0 +1,135 @@
+"""Fila de envio: reenvio depois de falha não duplica registros na planilha."""
+
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import gspread
+import pytest
+
+from armazenamento import COLUNA_ENVIO, ArmazenamentoSQLite, FilaEnvio, colunas_largas
+from conftest import armazenamento_simulado
+from simulacao import gerar_diario
+
+REGISTRO = ({'Data': "01/01/2025", 'Hora': "12:00", 'Escala de Bristol': 4}, {'ALIMENTO 001': 2})
+
+
+def _erro_429():
+    resposta = SimpleNamespace(json=lambda: {'error': {'code': 429, 'message': "Quota exceeded", 'status': "RESOURCE_EXHAUSTED"}})
+    return gspread.exceptions.APIError(resposta)
+
+class ArmazenamentoInstavel:
+    """Repassa ao diário simulado; as primeiras gravações falham depois (`gravar=True`) ou antes de gravar."""
+
+    def __init__(self, armazenamento, falhas):
+        self._armazenamento, self._falhas = armazenamento, list(falhas)
+
+    def __getattr__(self, nome):
+        return getattr(self._armazenamento, nome)
+
+    def adicionar_registros(self, registros):
+        if not self._falhas: return self._armazenamento.adicionar_registros(registros)
+        gravar, erro = self._falhas.pop(0)
+        if gravar: self._armazenamento.adicionar_registros(registros)  # Chegou, mas a resposta se perdeu
+        raise erro
+
+def _esvaziar(fila, limite=5.0):
+    fim = time.monotonic() + limite
+    while fila.pendentes() and time.monotonic() < fim:
+        fila.tentar_agora()
+        time.sleep(0.02)
+    assert not fila.pendentes()
+
+@pytest.mark.parametrize("falhas", [
+    [(True, TimeoutError("read timed out"))],
+    [(True, ConnectionError("reset")), (False, _erro_429())],
+    [(False, _erro_429()), (False, _erro_429())],
+], ids=["timeout-apos-gravar", "queda-e-cota", "cota"])
+def test_reenvio_nao_duplica(tmp_path, falhas):
+    base = armazenamento_simulado(gerar_diario(dias=5))
+    antes = len(base.ler_tudo()[1])
+    instavel = ArmazenamentoInstavel(base, falhas)
+    fila = FilaEnvio(str(tmp_path / "fila.jsonl"), lambda usuario: instavel, espera_inicial=0.01)
+    fila.enfileirar(*REGISTRO)
+    fila.enfileirar(*REGISTRO)
+    _esvaziar(fila)
+
+    headers, linhas = base.ler_tudo()
+    ids = [l[headers.index(COLUNA_ENVIO)] for l in linhas[antes:]]
+    assert len(linhas) - antes == 2 and len(set(ids)) == 2
+
+def test_reinicio_confere_o_que_ja_foi(tmp_path):
+    """Queda do app entre gravar e tirar da fila: a fila relida não reenvia."""
+    base = armazenamento_simulado(gerar_diario(dias=5))
+    caminho = str(tmp_path / "fila.jsonl")
+    antes = len(base.ler_tudo()[1])
+    fila = FilaEnvio(caminho, lambda usuario: ArmazenamentoInstavel(base, [(True, TimeoutError())]), espera_inicial=60)
+    fila.enfileirar(*REGISTRO)
+    fim = time.monotonic() + 5
+    while not fila.ultimo_erro and time.monotonic() < fim: time.sleep(0.02)
+
+    _esvaziar(FilaEnvio(caminho, lambda usuario: base))
+    assert len(base.ler_tudo()[1]) - antes == 1
+
+def test_segurar_pausa_o_diario(tmp_path):
+    base = armazenamento_simulado(gerar_diario(dias=5))
+    antes = len(base.ler_tudo()[1])
+    fila = FilaEnvio(str(tmp_path / "fila.jsonl"), lambda usuario: base, espera_inicial=0.01)
+    with fila.segurar(''):
+        fila.enfileirar(*REGISTRO)
+        time.sleep(0.1)
+        assert fila.pendentes() == 1 and len(base.ler_tudo()[1]) == antes
+    _esvaziar(fila)
+    assert len(base.ler_tudo()[1]) - antes == 1
+
+def test_coluna_de_envio_nao_pede_compactacao(tmp_path):
+    base = armazenamento_simulado(gerar_diario(dias=5))
+    fila = FilaEnvio(str(tmp_path / "fila.jsonl"), lambda usuario: base, espera_inicial=0.01)
+    fila.enfileirar(*REGISTRO)
+    _esvaziar(fila)
+    headers = base.cabecalho()
+    assert headers[-1] == COLUNA_ENVIO and colunas_largas(headers) == []
+
+def test_compactar_mantem_ids_de_envio(tmp_path):
+    """Aba no formato largo antigo com registros vindos da fila: a compactação preserva os ids."""
+    base = armazenamento_simulado(gerar_diario(dias=5))
+    base.garantir_colunas(['ALIMENTO 001'])
+    base._dados().append_rows([["02/01/2025", "08:00"] + [''] * (len(base.cabecalho()) - 3) + ["2"]])
+    fila = FilaEnvio(str(tmp_path / "fila.jsonl"), lambda usuario: base, espera_inicial=0.01)
+    fila.enfileirar(*REGISTRO)
+    _esvaziar(fila)
+    headers, linhas = base.ler_tudo()
+    ids = {l[headers.index(COLUNA_ENVIO)] for l in linhas} - {''}
+    assert len(ids) == 1 and colunas_largas(headers) == ['ALIMENTO 001']
+
+    base.compactar_formato_longo()
+    headers, linhas = base.ler_tudo()
+    assert colunas_largas(headers) == [] and headers[-1] == COLUNA_ENVIO
+    assert base.ids_gravados(ids | {'outro'}) == ids
+    assert any(l[headers.index('Consumo')] == "ALIMENTO 001=2" for l in linhas)
+
+def test_sqlite_nao_duplica(tmp_path):
+    """"database is locked" depois do commit: o SQLite confere `envio_id` e ignora id repetido."""
+    base = ArmazenamentoSQLite(str(tmp_path / "diario.db"))
+    instavel = ArmazenamentoInstavel(base, [(True, sqlite3.OperationalError("database is locked"))])
+    fila = FilaEnvio(str(tmp_path / "fila.jsonl"), lambda usuario: instavel, espera_inicial=0.01)
+    fila.enfileirar(*REGISTRO)
+    fila.enfileirar(*REGISTRO)
+    _esvaziar(fila)
+    assert len(base.ler_tudo()[1]) == 2
+
+    valores, consumo = REGISTRO
+    base.adicionar_registros([({**valores, COLUNA_ENVIO: "repetido"}, consumo)] * 2)
+    assert len(base.ler_tudo()[1]) == 3 and base.ids_gravados(["repetido", "outro"]) == {"repetido"}
+
+def test_sqlite_antigo_ganha_envio_id(tmp_path):
+    caminho = str(tmp_path / "antigo.db")
+    with sqlite3.connect(caminho) as con:
+        con.execute("CREATE TABLE registros (id INTEGER PRIMARY KEY AUTOINCREMENT, data_hora TEXT, data TEXT, hora TEXT, "
+                    "bristol TEXT, diarreia TEXT, caracteristicas TEXT, remedios TEXT, cintura TEXT, abdominal TEXT, "
+                    "notas TEXT, humor TEXT)")
+        con.execute("INSERT INTO registros (data, hora) VALUES ('01/01/2024', '08:00')")
+    con.close()
+    base = ArmazenamentoSQLite(caminho)
+    base.adicionar_registros([({**REGISTRO[0], COLUNA_ENVIO: "novo"}, REGISTRO[1])])
+    assert len(base.ler_tudo()[1]) == 2 and base.ids_gravados(["novo"]) == {"novo"}
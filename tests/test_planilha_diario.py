@@ -0,0 +1,19 @@
+"""Planilha própria de cada diário (DIARIO_PLANILHA_POR_USUARIO=1): criação e primeiro uso."""
+
+from armazenamento import CABECALHO_DADOS, ArmazenamentoSheets, criar_planilha_diario
+from simulacao import ClienteSimulado
+
+
+def test_criar_planilha_diario():
+    cliente = ClienteSimulado()
+    planilha = criar_planilha_diario(cliente, "Diario_Intestinal_DB_ana@x.com", "ana@x.com", "pasta-id")
+    assert cliente.open("Diario_Intestinal_DB_ana@x.com") is planilha and planilha.pasta == "pasta-id"
+    assert planilha.compartilhada_com == [("ana@x.com", 'writer')]
+
+    armazenamento = ArmazenamentoSheets(lambda: planilha)
+    assert armazenamento.cabecalho() == CABECALHO_DADOS
+    alimentos, _ = armazenamento.ler_listas_config(['ARROZ'], ['Gases'])
+    armazenamento.adicionar_registro({'Data': "01/01/2025", 'Hora': "12:00"}, {'ARROZ': 1})
+    headers, linhas = armazenamento.ler_tudo()
+    assert alimentos == ['ARROZ'] and len(linhas) == 1 and linhas[0][headers.index('Consumo')] == "ARROZ=1"
+    assert [aba.title for aba in planilha.worksheets()] == ['Dados', 'Config']
@@ -0,0 +1,53 @@
+"""Porto Seguro vetorizado (`calcular_porto_seguro`) contra o laço original, e benchmark por tamanho."""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from processamento import calcular_porto_seguro
+
+
+def porto_seguro_laco(df):
+    """Laço da versão original (O(n²)): janela dos 3 dias anteriores filtrando o df inteiro a cada registro."""
+    df_cron = df.sort_values('DataHora', kind='stable').reset_index()
+    df_cron['Porto_Seguro'] = False
+    for i in range(len(df_cron)):
+        if i < 3: continue
+        dt_atual = df_cron.loc[i, 'DataHora']
+        janela = df_cron[(df_cron['DataHora'] < dt_atual) & (df_cron['DataHora'] >= dt_atual - timedelta(days=3))]
+        if not janela.empty and not (janela['Escala de Bristol'] >= 5).any():
+            df_cron.loc[i, 'Porto_Seguro'] = True
+    return df_cron.set_index('index')['Porto_Seguro'].sort_index()
+
+def historico(n, semente):
+    """`n` registros em ordem aleatória, com horários repetidos e crises (Bristol >= 5) em rajadas."""
+    rnd = np.random.default_rng(semente)
+    minutos = rnd.integers(0, max(n, 10) * 6 * 60, n)
+    minutos[rnd.random(n) < 0.1] = minutos[0]  # Empates de horário
+    crise_rara = rnd.random() < 0.5
+    bristol = np.where(rnd.random(n) < (0.03 if crise_rara else 0.2), rnd.integers(5, 8, n), rnd.integers(0, 5, n))
+    return pd.DataFrame({'DataHora': pd.Timestamp(2024, 1, 1) + pd.to_timedelta(minutos, unit='min'),
+                         'Escala de Bristol': bristol.astype('int8')})
+
+@pytest.mark.parametrize("semente", range(100))
+def test_equivale_ao_laco(semente):
+    df = historico(int(np.random.default_rng(semente).integers(1, 400)), semente)
+    esperado = porto_seguro_laco(df)
+    obtido = calcular_porto_seguro(df['DataHora'], df['Escala de Bristol'] >= 5)
+    assert obtido.index.equals(df.index)
+    assert (obtido.to_numpy() == esperado.to_numpy()).all()
+
+@pytest.mark.parametrize("n", [1_000, 10_000, 100_000])
+def test_benchmark_vetorizado(benchmark, n):
+    df = historico(n, 0)
+    benchmark.group = "porto_seguro"
+    porto = benchmark(calcular_porto_seguro, df['DataHora'], df['Escala de Bristol'] >= 5)
+    assert len(porto) == n
+
+def test_benchmark_laco_1k(benchmark):
+    """Referência: o laço original em 1k registros (10k já leva dezenas de segundos)."""
+    df = historico(1_000, 0)
+    benchmark.group = "porto_seguro"
+    benchmark.pedantic(porto_seguro_laco, args=(df,), rounds=3)
@@ -0,0 +1,104 @@
+"""Tipagem da aba de Dados (`tipar_linhas`) contra o caminho antigo, numa planilha sintética de 50 mil linhas.
+
+Metade das linhas no formato largo antigo (uma coluna por item), metade na coluna Consumo.
+Além do tempo, cada benchmark registra em `extra_info` o pico de memória da conversão e o
+tamanho final de (registros, consumo).
+"""
+
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from armazenamento import CABECALHO_DADOS, COLUNA_CONSUMO, ler_consumo
+from processamento import consumo_vazio, tipar_linhas
+from simulacao import RASTREADORES_SIMULADOS, gerar_diario
+
+LINHAS = 50_000
+
+
+def _extrair_consumo_antigo(df, cols_itens):
+    partes = []
+    if cols_itens:
+        niveis = df[cols_itens].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+        lin, col = np.nonzero(niveis > 0)
+        partes.append(pd.DataFrame({'Registro': df['Registro'].to_numpy()[lin],
+                                    'item': np.asarray(cols_itens, dtype=object)[col], 'nivel': niveis[lin, col]}))
+    if COLUNA_CONSUMO in df.columns:
+        pares = df.set_index('Registro')[COLUNA_CONSUMO].astype(str).str.split(';').explode().str.strip()
+        pares = pares[pares != ''].str.rpartition('=')
+        nivel = pd.to_numeric(pares[2], errors='coerce')
+        pares = pd.DataFrame({'Registro': pares.index.to_numpy(), 'item': pares[0].str.strip().to_numpy(), 'nivel': nivel.to_numpy()})
+        partes.append(pares[pares['nivel'] > 0])
+    if not partes: return consumo_vazio()
+    consumo = pd.concat(partes, ignore_index=True)
+    consumo = consumo.groupby(['Registro', 'item'], as_index=False, sort=False)['nivel'].max()
+    return consumo.astype({'Registro': 'int32', 'item': 'category', 'nivel': 'int8'})
+
+def tipar_linhas_antigo(headers, linhas, cols_numericas, inicio=0):
+    """Caminho anterior: DataFrame de strings, `to_numeric` coluna a coluna e datas com `dayfirst` inferido."""
+    largura = len(headers)
+    df = pd.DataFrame([(list(l) + [''] * largura)[:largura] for l in linhas], columns=headers)
+    if df.empty: return df, consumo_vazio()
+    df['Registro'] = np.arange(inicio, inicio + len(df), dtype=np.int32)
+    cols_itens = [c for c in df.columns if c in cols_numericas]
+    consumo = _extrair_consumo_antigo(df, cols_itens)
+    df = df.drop(columns=cols_itens + ([COLUNA_CONSUMO] if COLUNA_CONSUMO in df.columns else []))
+    for col in ('Circunferencia_Cintura', 'Circunferencia_Abdominal'):
+        if col in df.columns: df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['Escala de Bristol'] = pd.to_numeric(df['Escala de Bristol'], errors='coerce').fillna(0)
+    df['DataHora'] = pd.to_datetime(df['Data'] + ' ' + df['Hora'], dayfirst=True, errors='coerce')
+    df = df.dropna(subset=['DataHora'])
+    return df, consumo[consumo['Registro'].isin(df['Registro'])]
+
+
+@pytest.fixture(scope="module")
+def planilha_50k():
+    """(cabeçalho, linhas, colunas numéricas): linhas pares no formato largo antigo, ímpares na coluna Consumo."""
+    diario = gerar_diario(dias=LINHAS // 4)
+    itens = [linha[0] for linha in diario['Config'][1:]] + RASTREADORES_SIMULADOS + [linha[0] for linha in diario['Receitas'][1:]]
+    fixas, i_consumo = len(CABECALHO_DADOS) - 1, CABECALHO_DADOS.index(COLUNA_CONSUMO)
+    headers = CABECALHO_DADOS[:fixas] + itens + [COLUNA_CONSUMO]
+    linhas = []
+    for i, linha in enumerate(diario['Dados'][1:LINHAS + 1]):
+        if i % 2: linhas.append(linha[:fixas] + [''] * len(itens) + [linha[i_consumo]])
+        else:
+            consumo = ler_consumo(linha[i_consumo])
+            linhas.append(linha[:fixas] + [str(int(consumo.get(item, 0))) for item in itens] + [''])
+    return headers, linhas, set(itens)
+
+def _tamanho(df, consumo):
+    return df.memory_usage(deep=True).sum() + consumo.memory_usage(deep=True).sum()
+
+def _medir(benchmark, tipar, planilha):
+    tracemalloc.start()
+    df, consumo = tipar(*planilha)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    benchmark.extra_info['pico_mb'] = round(pico / 2 ** 20, 1)
+    benchmark.extra_info['resultado_mb'] = round(_tamanho(df, consumo) / 2 ** 20, 1)
+    return benchmark.pedantic(tipar, args=planilha, rounds=3)
+
+def test_equivale_ao_antigo(planilha_50k):
+    df, consumo = tipar_linhas(*planilha_50k)
+    df_antigo, consumo_antigo = tipar_linhas_antigo(*planilha_50k)
+    assert len(df) == len(df_antigo) == len(planilha_50k[1])
+    assert _tamanho(df, consumo) < _tamanho(df_antigo, consumo_antigo)
+    pd.testing.assert_frame_equal(consumo.reset_index(drop=True), consumo_antigo.reset_index(drop=True))
+    for col in df_antigo.columns:
+        novo, antigo = df[col].reset_index(drop=True), df_antigo[col].reset_index(drop=True)
+        if col in ('Escala de Bristol', 'Circunferencia_Cintura', 'Circunferencia_Abdominal'):
+            assert np.allclose(novo.astype(float), antigo.astype(float), equal_nan=True), col
+        else:
+            assert (novo.astype(str) == antigo.astype(str)).all(), col
+
+@pytest.mark.benchmark(group="tipagem")
+def test_tipagem_atual(benchmark, planilha_50k):
+    df, _ = _medir(benchmark, tipar_linhas, planilha_50k)
+    assert len(df) == LINHAS
+
+@pytest.mark.benchmark(group="tipagem")
+def test_tipagem_antiga(benchmark, planilha_50k):
+    df, _ = _medir(benchmark, tipar_linhas_antigo, planilha_50k)
+    assert len(df) == LINHAS